@@ -0,0 +1,7 @@
+"""
+Benchmarks for the chat stack.
+
+Run them from the project root, e.g. ``python -m benchmarks.ws_chat --help``.
+Every benchmark prints (or writes with ``--output``) a JSON report so runs
+can be compared across commits.
+"""
@@ -0,0 +1,119 @@
+"""
+Consumer database path benchmark: the executor against Django's async ORM.
+
+Calls the queries ``ChatConsumer`` makes on its hot path directly, once
+with ``CHAT_ASYNC_ORM`` off (``chat.executor.database_task``) and once with
+it on, from ``--concurrency`` coroutines that each repeat them
+``--iterations`` times:
+
+* ``auth``      - the active-user lookup for tokens without a username claim
+* ``subscribe`` - thread membership plus the user's friend ids
+* ``replay``    - the messages after a sequence number, ``--replay`` of them
+* ``send``      - the transactional limit check and insert; this one runs
+  on the executor in both modes and is the control
+
+Latencies (p50/p95/p99) and operations per second are reported per mode and
+operation, on a scratch copy of the configured database.
+
+Usage::
+
+    python -m benchmarks.consumer_orm --concurrency 50 --iterations 20 --output orm.json
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.harness import scratch_database, setup_django, summarize, write_report
+
+MODES = {"executor": False, "async_orm": True}
+
+
+def create_fixtures(pairs, history):
+    """``pairs`` friend threads holding ``history`` messages each."""
+    from django.contrib.auth import get_user_model
+
+    from chat.models import Friendship, Message, Thread
+
+    User = get_user_model()
+    fixtures = []
+    for index in range(pairs):
+        user1 = User.objects.create_user(f"orm-{index}-a")
+        user2 = User.objects.create_user(f"orm-{index}-b")
+        Friendship.befriend(user1.id, user2.id)
+        thread, _ = Thread.open(user1, user2)
+        first = thread.allocate_seqs(history)
+        messages = Message.objects.bulk_create(
+            Message(thread=thread, sender=user1, content=f"m{seq}", seq=seq) for seq in range(first, first + history)
+        )
+        thread.record_messages(messages)
+        fixtures.append((user1, thread))
+    return fixtures
+
+
+def make_consumer(user):
+    from chat.consumers import ChatConsumer
+
+    consumer = ChatConsumer()
+    consumer.user = user
+    consumer.friend_ids = None
+    consumer.subscriptions = {}
+    return consumer
+
+
+async def run_mode(fixtures, concurrency, iterations, replay):
+    from chat.auth import get_active_user
+
+    timings = {name: [] for name in ("auth", "subscribe", "replay", "send")}
+
+    async def timed(name, awaitable):
+        started = time.perf_counter()
+        result = await awaitable
+        timings[name].append(time.perf_counter() - started)
+        return result
+
+    async def worker(index):
+        user, thread = fixtures[index % len(fixtures)]
+        for _ in range(iterations):
+            consumer = make_consumer(user)
+            await timed("auth", get_active_user(user.id))
+            subscriptions = await timed("subscribe", consumer.load_subscriptions([thread.id]))
+            await timed("replay", consumer.missed_messages(thread, 0, replay))
+            await timed("send", consumer.create_message(subscriptions[0], "benchmark"))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    results = {name: summarize(samples) for name, samples in timings.items()}
+    operations = sum(len(samples) for samples in timings.values())
+    results["total_seconds"] = round(elapsed, 3)
+    results["operations_per_second"] = round(operations / elapsed, 2) if elapsed else None
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, default=50, help="Coroutines running at once.")
+    parser.add_argument("--iterations", type=int, default=20, help="Rounds of queries per coroutine.")
+    parser.add_argument("--pairs", type=int, default=10, help="Users (and threads) the coroutines share.")
+    parser.add_argument("--history", type=int, default=100, help="Messages per thread before the run.")
+    parser.add_argument("--replay", type=int, default=50, help="Messages fetched per replay.")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout.")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.test import override_settings
+
+    results = {}
+    with scratch_database():
+        fixtures = create_fixtures(args.pairs, args.history)
+        for mode, enabled in MODES.items():
+            with override_settings(CHAT_ASYNC_ORM=enabled):
+                results[mode] = asyncio.run(run_mode(fixtures, args.concurrency, args.iterations, args.replay))
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    write_report("consumer_orm", config, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Message insert throughput across database profiles.
+
+Each profile is a set of environment overrides for ``core/settings.py``
+(see ``PROFILES``) and runs in its own process on a scratch copy of that
+database. ``--concurrency`` coroutines send ``--messages`` messages each
+through ``ChatConsumer.create_message``, the limit check and insert the
+consumer runs on the database executor, spread over ``--threads`` chat
+threads. Reported per profile: insert latency (p50/p95/p99), messages per
+second and failed inserts ("database is locked" and the like).
+
+The PostgreSQL profiles read the server from the ``POSTGRES_*`` variables
+and need a role allowed to create the test database.
+
+Usage::
+
+    python -m benchmarks.db_insert --profiles sqlite,sqlite_wal --concurrency 32 --messages 50
+    python -m benchmarks.db_insert --profiles sqlite_wal,postgresql,postgresql_pool --output insert.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.harness import BASE_DIR, scratch_database, setup_django, summarize, write_report
+
+PROFILES = {
+    "sqlite": {"DATABASE_ENGINE": "sqlite", "SQLITE_WAL": "False"},
+    "sqlite_wal": {"DATABASE_ENGINE": "sqlite", "SQLITE_WAL": "True"},
+    "postgresql": {"DATABASE_ENGINE": "postgresql", "POSTGRES_POOL": "False"},
+    "postgresql_pool": {"DATABASE_ENGINE": "postgresql", "POSTGRES_POOL": "True"},
+}
+
+
+def create_fixtures(thread_count):
+    """``thread_count`` threads between pairs of friends; returns (user, thread) pairs."""
+    from django.contrib.auth import get_user_model
+
+    from chat.models import Friendship, Thread
+
+    User = get_user_model()
+    fixtures = []
+    for index in range(thread_count):
+        user1 = User.objects.create_user(f"insert-{index}-a")
+        user2 = User.objects.create_user(f"insert-{index}-b")
+        Friendship.befriend(user1.id, user2.id)
+        thread, _ = Thread.open(user1, user2)
+        fixtures.append((user1, thread))
+    return fixtures
+
+
+async def send_messages(fixtures, concurrency, messages):
+    from django.db import DatabaseError
+
+    from benchmarks.consumer_orm import make_consumer
+    from chat.consumers import Subscription
+
+    latencies = []
+    errors = 0
+
+    async def sender(index):
+        nonlocal errors
+        user, thread = fixtures[index % len(fixtures)]
+        consumer = make_consumer(user)
+        subscription = Subscription(thread, user)
+        for sequence in range(messages):
+            started = time.perf_counter()
+            try:
+                await consumer.create_message(subscription, f"{index}#{sequence}")
+            except DatabaseError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(sender(index) for index in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "insert_ms": summarize(latencies),
+        "inserted": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(len(latencies) / elapsed, 2) if elapsed else None,
+    }
+
+
+def run_profile(args):
+    """Measure the database the current process is configured for."""
+    setup_django()
+    from django.conf import settings
+
+    from chat.models import Message
+
+    with scratch_database():
+        fixtures = create_fixtures(args.threads)
+        results = asyncio.run(send_messages(fixtures, args.concurrency, args.messages))
+        results["rows"] = Message.objects.count()
+    database = settings.DATABASES["default"]
+    results["database"] = {
+        "engine": database["ENGINE"],
+        "conn_max_age": database["CONN_MAX_AGE"],
+        "options": database["OPTIONS"],
+    }
+    return results
+
+
+def spawn_profile(name, args):
+    """Run one profile in a child process, so settings are read with its environment."""
+    command = [
+        sys.executable, "-m", "benchmarks.db_insert", "--child",
+        "--threads", str(args.threads), "--concurrency", str(args.concurrency), "--messages", str(args.messages),
+    ]
+    process = subprocess.run(
+        command, cwd=BASE_DIR, env={**os.environ, **PROFILES[name]}, capture_output=True, text=True
+    )
+    if process.returncode:
+        lines = process.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit status {process.returncode}"}
+    return json.loads(process.stdout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--profiles", default="sqlite,sqlite_wal",
+                        help=f"Comma-separated profiles out of {', '.join(PROFILES)}.")
+    parser.add_argument("--threads", type=int, default=10, help="Chat threads the senders share.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Coroutines sending at once.")
+    parser.add_argument("--messages", type=int, default=50, help="Messages per coroutine.")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout.")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    # Measure the database, not the send limits or the executor's shedding
+    os.environ.setdefault("CHAT_RATE_LIMITS_ENABLED", "False")
+    os.environ.setdefault("CHAT_DB_QUEUE", str(args.concurrency))
+
+    if args.child:
+        print(json.dumps(run_profile(args), default=str))
+        return
+
+    profiles = [name for name in args.profiles.split(",") if name]
+    unknown = set(profiles) - set(PROFILES)
+    if unknown:
+        parser.error(f"unknown profiles: {', '.join(sorted(unknown))}")
+
+    results = {name: spawn_profile(name, args) for name in profiles}
+    setup_django()
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "child")}
+    write_report("db_insert", config, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Shared plumbing for the benchmarks: Django setup, databases, stats and reports."""
+import datetime
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    import django
+
+    django.setup()
+
+
+@contextmanager
+def scratch_database():
+    """
+    Run against a throwaway copy of the configured database, created and
+    migrated like the test runner does. SQLite gets a temporary file instead
+    of the in-memory test database so the consumer's worker threads can
+    write to it concurrently.
+    """
+    from django.conf import settings
+    from django.test.utils import setup_databases, teardown_databases
+
+    tmpdir = None
+    database = settings.DATABASES["default"]
+    if database["ENGINE"] == "django.db.backends.sqlite3":
+        tmpdir = tempfile.TemporaryDirectory()
+        database.setdefault("TEST", {})["NAME"] = os.path.join(tmpdir.name, "bench.sqlite3")
+
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def uvicorn_server(env=None, timeout=10.0):
+    """Start ``core.asgi:application`` under uvicorn on a free port, yield its ws:// base URL."""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "core.asgi:application",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BASE_DIR,
+        env={**os.environ, **(env or {})},
+    )
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                    break
+            except OSError:
+                if time.monotonic() > deadline or process.poll() is not None:
+                    raise RuntimeError(f"uvicorn did not start on port {port}")
+                time.sleep(0.1)
+        yield f"ws://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(samples):
+    """p50/p95/p99/mean/max of a list of seconds, reported in milliseconds."""
+    values = sorted(sample * 1000 for sample in samples)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 3),
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(values[-1], 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=BASE_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_report(name, config, results, output=None):
+    """Wrap results with run metadata and write them as JSON to ``output`` or stdout."""
+    from django.conf import settings
+
+    report = {
+        "benchmark": name,
+        "commit": git_revision(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "database": settings.DATABASES["default"]["ENGINE"],
+        "channel_layer": settings.CHANNEL_LAYERS["default"]["BACKEND"],
+        "config": config,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        Path(output).write_text(text + "\n")
+    else:
+        print(text)
+    return report
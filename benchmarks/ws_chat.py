@@ -0,0 +1,252 @@
+"""
+WebSocket chat benchmark: connect time, round-trip latency and throughput
+through ``ChatConsumer``.
+
+It opens ``--threads`` chat threads with ``--clients`` connections each
+(alternating between the thread's two participants, as if on several
+devices). Every connection then sends ``--rate`` messages per second for
+``--duration`` seconds. Two latencies are reported:
+
+* ``round_trip_ms`` - from send until the sender gets its own broadcast back
+* ``delivery_ms``   - from send until each other connection in the thread
+  receives it
+
+Modes:
+
+* ``inprocess`` (default) - ``channels.testing.WebsocketCommunicator`` against
+  the ASGI app in this process, on a scratch copy of the database
+* ``socket`` - real WebSockets against uvicorn, either ``--url`` or a server
+  started on a free port; fixtures go into the configured database and are
+  removed afterwards
+
+Usage::
+
+    python -m benchmarks.ws_chat --threads 10 --clients 2 --rate 5 --duration 10 --output ws.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from contextlib import nullcontext
+
+from benchmarks.harness import scratch_database, setup_django, summarize, uvicorn_server, write_report
+
+
+class InProcessClient:
+    def __init__(self, application, path):
+        from channels.testing import WebsocketCommunicator
+
+        self.communicator = WebsocketCommunicator(application, path)
+
+    async def connect(self):
+        connected, _ = await self.communicator.connect()
+        if not connected:
+            raise RuntimeError("WebSocket connection was rejected")
+
+    async def send(self, text):
+        await self.communicator.send_to(text_data=text)
+
+    async def recv(self):
+        return await self.communicator.receive_from(timeout=3600)
+
+    async def close(self):
+        await self.communicator.disconnect()
+
+
+class SocketClient:
+    def __init__(self, url):
+        self.url = url
+        self.socket = None
+
+    async def connect(self):
+        from websockets.asyncio.client import connect
+
+        self.socket = await connect(self.url, max_queue=None)
+
+    async def send(self, text):
+        await self.socket.send(text)
+
+    async def recv(self):
+        return await self.socket.recv()
+
+    async def close(self):
+        await self.socket.close()
+
+
+def create_fixtures(thread_count):
+    """``thread_count`` threads between pairs of fresh users who are friends."""
+    from django.contrib.auth import get_user_model
+
+    from chat.auth import access_token_for
+    from chat.models import Friendship, Thread
+
+    User = get_user_model()
+    run = uuid.uuid4().hex[:8]
+    threads = []
+    for index in range(thread_count):
+        user1 = User.objects.create_user(f"bench-{run}-{index}-a")
+        user2 = User.objects.create_user(f"bench-{run}-{index}-b")
+        Friendship.befriend(user1.id, user2.id)
+        thread, _ = Thread.open(user1, user2)
+        threads.append((thread.id, [str(access_token_for(user1)), str(access_token_for(user2))]))
+    return run, threads
+
+
+def delete_fixtures(run):
+    from django.contrib.auth import get_user_model
+
+    get_user_model().objects.filter(username__startswith=f"bench-{run}-").delete()
+
+
+class Run:
+    def __init__(self, make_client, threads, clients_per_thread, rate, duration, drain_timeout):
+        self.make_client = make_client
+        self.threads = threads
+        self.clients_per_thread = clients_per_thread
+        self.rate = rate
+        self.duration = duration
+        self.drain_timeout = drain_timeout
+
+        self.sent_at = {}
+        self.sent = 0
+        self.received = 0
+        self.expected = 0
+        self.connect_times = []
+        self.round_trips = []
+        self.deliveries = []
+        self.errors = 0
+        self.sending = True
+        self.all_delivered = asyncio.Event()
+
+    async def open(self, thread_id, token):
+        client = self.make_client(f"/ws/chat/{thread_id}/?token={token}")
+        started = time.perf_counter()
+        await client.connect()
+        self.connect_times.append(time.perf_counter() - started)
+        return client
+
+    async def read(self, name, client):
+        while True:
+            frame = json.loads(await client.recv())
+            if frame.get("type") != "chat.message":
+                if frame.get("type") in ("error", "limit_reached"):
+                    self.errors += 1
+                continue
+            sender, _, _ = frame["message"].partition("#")
+            started = self.sent_at.get(frame["message"])
+            if started is None:
+                continue
+            elapsed = time.perf_counter() - started
+            (self.round_trips if sender == name else self.deliveries).append(elapsed)
+            self.received += 1
+            if not self.sending and self.received >= self.expected:
+                self.all_delivered.set()
+
+    async def write(self, name, client, peers):
+        interval = 1 / self.rate
+        deadline = time.perf_counter() + self.duration
+        sequence = 0
+        while time.perf_counter() < deadline:
+            text = f"{name}#{sequence}"
+            sequence += 1
+            self.sent_at[text] = time.perf_counter()
+            self.sent += 1
+            self.expected += peers
+            await client.send(json.dumps({"message": text}))
+            await asyncio.sleep(interval)
+
+    async def __call__(self):
+        clients = []
+        for thread_id, tokens in self.threads:
+            for index in range(self.clients_per_thread):
+                clients.append((f"t{thread_id}c{index}", thread_id, tokens[index % 2]))
+
+        sockets = await asyncio.gather(*(self.open(thread_id, token) for _, thread_id, token in clients))
+        readers = [asyncio.create_task(self.read(name, sock)) for (name, _, _), sock in zip(clients, sockets)]
+
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            self.write(name, sock, self.clients_per_thread) for (name, _, _), sock in zip(clients, sockets)
+        ))
+        send_elapsed = time.perf_counter() - started
+        self.sending = False
+        if self.received >= self.expected:
+            self.all_delivered.set()
+        try:
+            await asyncio.wait_for(self.all_delivered.wait(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            pass
+        elapsed = time.perf_counter() - started
+
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        await asyncio.gather(*(sock.close() for sock in sockets), return_exceptions=True)
+
+        return {
+            "connections": len(sockets),
+            "connect_ms": summarize(self.connect_times),
+            "round_trip_ms": summarize(self.round_trips),
+            "delivery_ms": summarize(self.deliveries),
+            "throughput": {
+                "messages_sent": self.sent,
+                "frames_expected": self.expected,
+                "frames_delivered": self.received,
+                "errors": self.errors,
+                "send_seconds": round(send_elapsed, 3),
+                "total_seconds": round(elapsed, 3),
+                "messages_per_second": round(self.sent / send_elapsed, 2) if send_elapsed else None,
+                "deliveries_per_second": round(self.received / elapsed, 2) if elapsed else None,
+            },
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mode", choices=["inprocess", "socket"], default="inprocess")
+    parser.add_argument("--url", help="Base ws:// URL for --mode socket; a uvicorn server is started if omitted.")
+    parser.add_argument("--threads", type=int, default=10, help="Chat threads (N).")
+    parser.add_argument("--clients", type=int, default=2, help="Connections per thread (M).")
+    parser.add_argument("--rate", type=float, default=5.0, help="Messages per second per connection.")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds each connection keeps sending.")
+    parser.add_argument("--drain-timeout", type=float, default=10.0, help="Seconds to wait for in-flight messages.")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout.")
+    args = parser.parse_args(argv)
+
+    # Measure the stack, not the send limits; uvicorn workers inherit this too
+    os.environ.setdefault("CHAT_RATE_LIMITS_ENABLED", "False")
+    setup_django()
+
+    if args.mode == "inprocess":
+        from core.asgi import application
+
+        database = scratch_database()
+        server = nullcontext(None)
+    else:
+        database = nullcontext()
+        server = nullcontext(args.url) if args.url else uvicorn_server()
+
+    with database, server as base_url:
+        run_id, threads = create_fixtures(args.threads)
+        try:
+            if args.mode == "inprocess":
+                def make_client(path):
+                    return InProcessClient(application, path)
+            else:
+                def make_client(path):
+                    return SocketClient(base_url + path)
+
+            results = asyncio.run(
+                Run(make_client, threads, args.clients, args.rate, args.duration, args.drain_timeout)()
+            )
+        finally:
+            delete_fixtures(run_id)
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    write_report("ws_chat", config, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 from django.contrib import admin
-from .models import FriendRequest, Friendship, Thread, Message
+from .models import FriendRequest, Friendship, Thread, Message, MessageArchiveSegment, ReadReceipt
 
 admin.site.register(FriendRequest)
 admin.site.register(Friendship)
 admin.site.register(Thread)
 admin.site.register(Message)
+admin.site.register(ReadReceipt)
+admin.site.register(MessageArchiveSegment)
@@ -0,0 +1,140 @@
+"""
+Cold storage for old messages.
+
+``archive_messages`` moves messages older than ``CHAT_ARCHIVE["AGE_DAYS"]``
+out of the ``Message`` table into ``MessageArchiveSegment`` rows, one
+zlib-compressed JSON batch of at most ``BATCH_SIZE`` messages per segment.
+Each batch is one short transaction: write the segment, delete the rows.
+
+A thread is always archived from its oldest message on, in ``(timestamp,
+id)`` order, so its segments sort before every message still in the table
+and ``MessageCursorPagination`` can page past the table into them. The
+thread's latest message is never archived; the inbox preview points at it.
+
+Archived messages keep their ids, uids and sequence numbers but leave the
+search index and can no longer be marked read.
+"""
+import json
+import uuid
+import zlib
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from chat.models import Message, MessageArchiveSegment
+
+CODEC = "zlib"
+
+DEFAULTS = {
+    "AGE_DAYS": 180,
+    "BATCH_SIZE": 500,
+}
+
+
+def archive_settings():
+    return {**DEFAULTS, **getattr(settings, "CHAT_ARCHIVE", {})}
+
+
+def archive_cutoff():
+    return timezone.now() - timedelta(days=archive_settings()["AGE_DAYS"])
+
+
+def pack(messages):
+    rows = [
+        [message.id, str(message.uid), message.seq, message.sender_id, message.content, message.timestamp.isoformat()]
+        for message in messages
+    ]
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode())
+
+
+def unpack(segment, thread):
+    """The segment's messages in history order, as unsaved ``Message`` instances."""
+    if segment.codec != CODEC:
+        raise ValueError(f"Unknown archive codec {segment.codec!r}")
+    participants = {thread.user1_id: thread.user1, thread.user2_id: thread.user2}
+    messages = []
+    for message_id, uid, seq, sender_id, content, timestamp in json.loads(zlib.decompress(segment.data)):
+        message = Message(
+            id=message_id,
+            uid=uuid.UUID(uid),
+            seq=seq,
+            thread=thread,
+            sender_id=sender_id,
+            content=content,
+            timestamp=datetime.fromisoformat(timestamp),
+        )
+        if sender_id in participants:
+            message.sender = participants[sender_id]
+        messages.append(message)
+    return messages
+
+
+def archive_batch(thread, cutoff, batch_size):
+    """Archive up to ``batch_size`` of the thread's oldest messages sent before ``cutoff``; returns how many."""
+    with transaction.atomic():
+        messages = list(
+            thread.messages.filter(timestamp__lt=cutoff)
+            .exclude(uid=thread.last_message_id)
+            .order_by("timestamp", "id")[:batch_size]
+        )
+        if not messages:
+            return 0
+        ids = [message.id for message in messages]
+        MessageArchiveSegment.objects.create(
+            thread=thread,
+            first_timestamp=messages[0].timestamp,
+            first_message_id=messages[0].id,
+            last_timestamp=messages[-1].timestamp,
+            last_message_id=messages[-1].id,
+            min_message_id=min(ids),
+            max_message_id=max(ids),
+            message_count=len(messages),
+            codec=CODEC,
+            data=pack(messages),
+        )
+        Message.objects.filter(pk__in=ids).delete()
+    return len(messages)
+
+
+def archived_messages(thread, key, direction, limit):
+    """
+    Up to ``limit`` archived messages of ``thread`` in scan order: ascending
+    after the ``(timestamp, id)`` key for ``"after"``, descending before it
+    otherwise (from the newest archived message when ``key`` is None).
+    """
+    segments = thread.archive_segments.all()
+    if direction == "after":
+        if key is not None:
+            segments = segments.filter(
+                Q(last_timestamp__gt=key[0]) | Q(last_timestamp=key[0], last_message_id__gt=key[1])
+            )
+        segments = segments.order_by("last_timestamp", "last_message_id")
+    else:
+        if key is not None:
+            segments = segments.filter(
+                Q(first_timestamp__lt=key[0]) | Q(first_timestamp=key[0], first_message_id__lt=key[1])
+            )
+        segments = segments.order_by("-last_timestamp", "-last_message_id")
+
+    rows = []
+    for segment in segments.iterator(chunk_size=4):
+        messages = unpack(segment, thread)
+        if direction == "after":
+            rows += [message for message in messages if key is None or (message.timestamp, message.id) > key]
+        else:
+            rows += [message for message in reversed(messages) if key is None or (message.timestamp, message.id) < key]
+        if len(rows) >= limit:
+            break
+    return rows[:limit]
+
+
+def find_archived_message(thread, message_id):
+    segments = thread.archive_segments.filter(min_message_id__lte=message_id, max_message_id__gte=message_id)
+    for segment in segments:
+        for message in unpack(segment, thread):
+            if message.id == message_id:
+                return message
+    return None
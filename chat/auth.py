@@ -0,0 +1,131 @@
+"""
+JWT authentication for WebSocket connections.
+
+``JWTAuthMiddleware`` validates the access token offline and puts a lazy
+user on ``scope["user"]``: a ``User`` instance built from the token's
+``user_id`` and ``username`` claims whose other fields are deferred, so
+Django only queries the database if one of them is actually read.
+
+Because the user row is not read on connect, deactivated and deleted users
+are kept on a denylist in the ``CHAT_JWT_DENYLIST_CACHE`` cache alias until
+their outstanding tokens expire. Other workers only see the denylist through
+a shared cache; when the alias is per-process (locmem, dummy) the middleware
+does not trust the claims and loads the active user instead.
+"""
+from urllib.parse import parse_qs
+
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import router
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat.executor import database_task, use_async_orm
+
+User = get_user_model()
+
+USERNAME_CLAIM = "username"
+DENYLIST_KEY = "chat:auth:denied:{}"
+
+
+def denylist_ttl():
+    default = settings.SIMPLE_JWT.get("ACCESS_TOKEN_LIFETIME", api_settings.ACCESS_TOKEN_LIFETIME)
+    return int(getattr(settings, "CHAT_JWT_DENYLIST_TTL", default.total_seconds()))
+
+
+def denylist_cache():
+    return caches[getattr(settings, "CHAT_JWT_DENYLIST_CACHE", "default")]
+
+
+def denylist_is_shared():
+    """Whether a user denied by one process is seen by the others."""
+    return not isinstance(denylist_cache(), (LocMemCache, DummyCache))
+
+
+def deny_user(user_id):
+    """Refuse tokens of ``user_id`` for as long as they can still be valid."""
+    denylist_cache().set(DENYLIST_KEY.format(user_id), True, denylist_ttl())
+
+
+def allow_user(user_id):
+    denylist_cache().delete(DENYLIST_KEY.format(user_id))
+
+
+async def is_user_denied(user_id):
+    return await denylist_cache().aget(DENYLIST_KEY.format(user_id), False)
+
+
+def user_from_claims(user_id, username):
+    """A ``User`` holding only the primary key and username; other fields load on access."""
+    loaded = {User._meta.pk.attname: User._meta.pk.to_python(user_id), User.USERNAME_FIELD: username}
+    field_names = [field.attname for field in User._meta.concrete_fields if field.attname in loaded]
+    return User.from_db(router.db_for_read(User), field_names, [loaded[name] for name in field_names])
+
+
+def access_token_for(user):
+    """An access token carrying the claims read by ``JWTAuthMiddleware``."""
+    token = AccessToken.for_user(user)
+    token[USERNAME_CLAIM] = user.get_username()
+    return token
+
+
+def get_raw_token(scope):
+    """The bearer token from the Authorization header or the ``token`` query parameter."""
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode().partition(" ")
+            if scheme in api_settings.AUTH_HEADER_TYPES and token:
+                return token
+    tokens = parse_qs(scope.get("query_string", b"").decode()).get("token")
+    return tokens[0] if tokens else None
+
+
+def active_users(user_id):
+    return User.objects.filter(pk=user_id, is_active=True)
+
+
+@database_task(shed=False)
+def fetch_active_user(user_id):
+    return active_users(user_id).first()
+
+
+async def get_active_user(user_id):
+    if use_async_orm():
+        return await active_users(user_id).afirst()
+    return await fetch_active_user(user_id)
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """Populates ``scope["user"]`` from a simplejwt access token."""
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        scope["user"] = await self.authenticate(scope) or AnonymousUser()
+        return await super().__call__(scope, receive, send)
+
+    async def authenticate(self, scope):
+        raw_token = get_raw_token(scope)
+        if not raw_token:
+            return None
+
+        try:
+            token = AccessToken(raw_token)
+        except TokenError:
+            return None
+
+        user_id = token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None or await is_user_denied(user_id):
+            return None
+
+        username = token.get(USERNAME_CLAIM)
+        if username is None or not denylist_is_shared():
+            # Issued before the username claim existed, or another worker may
+            # have denied the user without this one knowing
+            return await get_active_user(user_id)
+        return user_from_claims(user_id, username)
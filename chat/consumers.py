@@ -1,104 +1,598 @@
-import json
+import asyncio
+from urllib.parse import parse_qs
 
-from channels.db import database_sync_to_async
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.db import transaction
 from django.db.models import Q
-from rest_framework_simplejwt.tokens import AccessToken
 
-from chat.models import Thread, Message, Friendship
+from chat import friends, recent
+from chat.events import read_event, thread_group_name, user_group_name
+from chat.executor import ServerBusy, database_task, use_async_orm
+from chat.instrumentation import InstrumentedConsumerMixin
+from chat.models import Thread, Message, ReadReceipt, NON_FRIEND_MESSAGE_LIMIT
+from chat.outbox import SLOW_CONSUMER_CLOSE_CODE, Outbox, outbox_settings
+from chat.persistence import ACK_AFTER_BROADCAST, get_message_writer, queued_messages, write_behind_settings
+from chat.presence import get_presence_store, presence_ttl
+from chat.protocol import encode_broadcast, negotiate
+from chat.ratelimit import ConnectionRateLimiter, rate_limit, take_user_token
 
-User = get_user_model()
+# Frames that only travel over the channel layer and never touch the database;
+# typing is scoped to a thread, the others to the user
+EPHEMERAL_TYPES = ("typing", "heartbeat", "presence")
+# Frames metered by token buckets, see chat.ratelimit
+RATE_LIMITED_TYPES = ("message", "read", "subscribe")
+# "Try Again Later": the database executor was too busy to authorize the connection
+SERVER_BUSY_CLOSE_CODE = 1013
 
-class ChatConsumer(AsyncWebsocketConsumer):
 
-    async def connect(self):
-        self.thread_id = self.scope["url_route"]["kwargs"]["thread_id"]
-        self.thread_group_name = f"chat_{self.thread_id}"
+class Subscription:
+    """A thread a connection is subscribed to, with the state cached for it."""
 
-        query_params = self.scope["query_string"].decode()
-        token_key = query_params.split("token=")[1] if "token=" in query_params else None
+    def __init__(self, thread, user):
+        self.thread = thread
+        self.receiver = thread.get_other_user(user)
+        self.group_name = thread_group_name(thread.id)
+        # Live messages up to this seq, and unsaved write-behind messages
+        # with these uids, were already sent by replay()
+        self.replayed_seq = 0
+        self.replayed_uids = set()
 
-        if not token_key:
-            await self.close(code=403)
-            return
 
-        self.user = await self.get_user_from_token(token_key)
-        if not self.user:
+def message_frame(msg, sender):
+    return {
+        "type": "chat.message",
+        "thread_id": msg.thread_id,
+        "id": msg.pk,
+        "uid": str(msg.uid),
+        "seq": msg.seq,
+        "message": msg.content,
+        "sender": sender,
+        "timestamp": msg.timestamp.isoformat(),
+    }
+
+
+class BaseChatConsumer(InstrumentedConsumerMixin, AsyncWebsocketConsumer):
+    """
+    Chat over one socket for any number of subscribed threads.
+
+    Thread-scoped frames (messages, reads, typing) carry a ``thread_id``;
+    ``default_thread_id`` is used when they don't. Participants, receivers
+    and the user's friend ids are loaded when a thread is subscribed and
+    cached for the life of the connection.
+    """
+
+    # Accept subscribe/unsubscribe frames and forward user-level events
+    multiplexed = False
+    default_thread_id = None
+
+    async def connect(self):
+        self.codec, subprotocol = negotiate(self.scope.get("subprotocols", ()))
+        self.ack_tasks = set()
+        self.subscriptions = {}
+        # Friend ids; None until loaded or after a friendship change
+        self.friend_ids = None
+        # Read receipts are coalesced here and flushed by flush_reads_later()
+        self.pending_reads = {}
+        self.last_read_flush = 0.0
+        self.read_flush_task = None
+        self.last_ephemeral = {}
+        self.rate_limiter = ConnectionRateLimiter()
+        # Frames go out through the outbox, sent in order by drain_outbox()
+        config = outbox_settings()
+        self.outbox = Outbox(config["HIGH_WATER"], config["LIMIT"])
+        self.outbox_task = None
+        # {thread_id: last_seq} to replay once the socket is accepted
+        self.resume_from = {}
+
+        # Set by chat.auth.JWTAuthMiddleware without querying the user table
+        self.user = self.scope["user"]
+        if not self.user.is_authenticated:
             await self.close(code=403)
             return
 
-        allowed = await self.user_in_thread()
+        try:
+            allowed = await self.authorize()
+        except ServerBusy:
+            await self.close(code=SERVER_BUSY_CLOSE_CODE)
+            return
         if not allowed:
             await self.close(code=403)
             return
 
-        await self.channel_layer.group_add(self.thread_group_name, self.channel_name)
-        await self.accept()
+        # Friendship changes, new threads and friend requests arrive on the per-user group
+        self.user_group_name = user_group_name(self.user.id)
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+        await self.accept(subprotocol)
+        self.outbox_task = asyncio.create_task(self.drain_outbox())
+
+        if await get_presence_store().add(self.user.id, self.channel_name, presence_ttl()):
+            await self.broadcast_presence("online")
+
+        for thread_id, last_seq in self.resume_from.items():
+            try:
+                await self.replay(self.subscriptions[thread_id], last_seq)
+            except ServerBusy:
+                await self.send_frame({"type": "server_busy", "event": "resume", "thread_id": thread_id})
+
+    async def authorize(self):
+        """Whether to accept the connection; runs before ``accept()``."""
+        return True
 
     async def disconnect(self, close_code):
-        if hasattr(self, "thread_group_name"):
-            await self.channel_layer.group_discard(self.thread_group_name, self.channel_name)
+        if self.outbox_task is not None:
+            self.outbox_task.cancel()
+        if self.read_flush_task is not None:
+            self.read_flush_task.cancel()
+            await self.flush_reads()
+        for subscription in self.subscriptions.values():
+            await self.channel_layer.group_discard(subscription.group_name, self.channel_name)
+        if hasattr(self, "user_group_name"):
+            await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+            if await get_presence_store().remove(self.user.id, self.channel_name):
+                await self.broadcast_presence("offline")
+        for task in self.ack_tasks:
+            task.cancel()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = self.codec.decode(text_data, bytes_data)
+        except ValueError:
+            # Invalid JSON or msgpack, bad UTF-8 or not an object; the socket stays open
+            await self.send_frame({"type": "error", "message": "Malformed frame."})
+            return
+        kind = data.get("type", "message")
+        try:
+            await self.receive_frame(kind, data)
+        except ServerBusy:
+            # The database executor's queue is full; the client may retry later
+            await self.send_frame({
+                "type": "server_busy",
+                "event": kind,
+                "thread_id": data.get("thread_id", self.default_thread_id),
+            })
+
+    async def receive_frame(self, kind, data):
+        if kind in RATE_LIMITED_TYPES and not await self.take_token(kind, data):
+            return
+        if kind in ("subscribe", "unsubscribe") and self.multiplexed:
+            await self.receive_subscription(kind, data)
+            return
+        if kind in EPHEMERAL_TYPES and kind != "typing":
+            await self.receive_ephemeral(kind, None)
+            return
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+        subscription = self.get_subscription(data)
+        if subscription is None:
+            await self.send_frame({
+                "type": "error",
+                "thread_id": data.get("thread_id"),
+                "message": "You are not subscribed to this thread.",
+            })
+            return
+
+        if kind == "read":
+            self.receive_read(subscription, data)
+        elif kind == "typing":
+            await self.receive_ephemeral(kind, subscription, data)
+        elif kind == "message":
+            await self.receive_message(subscription, data)
+
+    async def take_token(self, kind, data):
+        """Spend a token for ``kind``; when none is left tell the client when to retry and return False."""
+        wait = self.rate_limiter.take(kind)
+        if not wait and rate_limit(kind, "user") is not None:
+            # A cache round trip that touches no database connection, so it need
+            # not queue on asgiref's single thread-sensitive worker
+            wait = await sync_to_async(take_user_token, thread_sensitive=False)(self.user.id, kind)
+        if wait:
+            await self.send_frame({
+                "type": "rate_limited",
+                "event": kind,
+                "thread_id": data.get("thread_id", self.default_thread_id),
+                "retry_after": round(wait, 3),
+            })
+        return not wait
+
+    def get_subscription(self, data):
+        try:
+            thread_id = int(data.get("thread_id", self.default_thread_id))
+        except (TypeError, ValueError):
+            return None
+        return self.subscriptions.get(thread_id)
+
+    async def send_frame(self, frame, ephemeral=False, key=None):
+        await self.push(self.codec.encode(frame), ephemeral, key)
+
+    async def push(self, payload, ephemeral=False, key=None):
+        """Queue ``send()`` kwargs on the outbox; close the socket if the client has fallen too far behind."""
+        if self.outbox_task is None or self.outbox_task.done():
+            return
+        if not self.outbox.put(payload, ephemeral, key):
+            self.outbox_task.cancel()
+            self.outbox.clear()
+            await self.close(code=SLOW_CONSUMER_CLOSE_CODE, reason="Too far behind; reconnect with last_seq.")
+
+    async def drain_outbox(self):
+        while True:
+            await self.send(**await self.outbox.get())
+
+    # --- Subscriptions ---
+
+    async def subscribe(self, thread_ids):
+        """Join every thread in ``thread_ids`` the user takes part in; returns (joined, denied)."""
+        wanted = [thread_id for thread_id in thread_ids if thread_id not in self.subscriptions]
+        room = settings.CHAT_MAX_SUBSCRIPTIONS - len(self.subscriptions)
+        loaded = await self.load_subscriptions(wanted[:max(room, 0)])
+
+        for subscription in loaded:
+            self.subscriptions[subscription.thread.id] = subscription
+            await self.channel_layer.group_add(subscription.group_name, self.channel_name)
+
+        joined = [thread_id for thread_id in thread_ids if thread_id in self.subscriptions]
+        denied = [thread_id for thread_id in thread_ids if thread_id not in self.subscriptions]
+        return joined, denied
+
+    async def unsubscribe(self, thread_ids):
+        left = []
+        for thread_id in thread_ids:
+            subscription = self.subscriptions.pop(thread_id, None)
+            if subscription is not None:
+                self.pending_reads.pop(thread_id, None)
+                await self.channel_layer.group_discard(subscription.group_name, self.channel_name)
+                left.append(thread_id)
+        return left
+
+    async def receive_subscription(self, kind, data):
+        try:
+            thread_ids = [int(thread_id) for thread_id in data.get("thread_ids", [])]
+            last_seqs = {int(thread_id): int(seq) for thread_id, seq in data.get("last_seq", {}).items()}
+        except (AttributeError, TypeError, ValueError):
+            await self.send_frame({
+                "type": "error",
+                "message": "thread_ids must be a list of ids and last_seq a map of thread id to seq.",
+            })
+            return
+
+        if kind == "subscribe":
+            joined, denied = await self.subscribe(thread_ids)
+            await self.send_frame({"type": "subscribed", "thread_ids": joined, "denied": denied})
+            for thread_id in joined:
+                if thread_id in last_seqs:
+                    await self.replay(self.subscriptions[thread_id], last_seqs[thread_id])
+        else:
+            left = await self.unsubscribe(thread_ids)
+            await self.send_frame({"type": "unsubscribed", "thread_ids": left})
+
+    # --- Messages ---
+
+    async def receive_message(self, subscription, data):
         message = data.get("message", "")
         if not message:
             return
 
-        saved_message = await self.create_message(message)
+        # Write-behind only covers friends: the non-friend limit needs the
+        # committed counter, so those messages stay on the synchronous path.
+        write_behind = write_behind_settings()
+        if write_behind["ENABLED"] and self.is_friend(subscription):
+            await self.send_write_behind(subscription, message, write_behind["ACK"])
+            return
+
+        saved_message = await self.create_message(subscription, message)
 
         if saved_message is None:
-            await self.send(text_data=json.dumps({
+            await self.send_frame({
                 "type": "limit_reached",
-                "message": "You have reached the 20-message limit. Add this user as a friend to continue chatting."
-            }))
+                "thread_id": subscription.thread.id,
+                "message": f"You have reached the {NON_FRIEND_MESSAGE_LIMIT}-message limit. "
+                           "Add this user as a friend to continue chatting."
+            })
             return
 
-        await self.channel_layer.group_send(
-            self.thread_group_name,
-            {
-                "type": "chat.message",
-                "message": saved_message["message"],
-                "sender": saved_message["sender"],
-            },
-        )
+        await self.channel_layer.group_send(subscription.group_name, saved_message)
 
-    async def chat_message(self, event):
-        await self.send(text_data=json.dumps(event))
+    def is_friend(self, subscription):
+        return self.friend_ids is not None and subscription.receiver.id in self.friend_ids
 
-    @database_sync_to_async
-    def get_user_from_token(self, token_key):
+    async def send_write_behind(self, subscription, message, ack):
+        """Broadcast first, persist in the next batch, ack per the durability mode."""
+        msg = Message(thread=subscription.thread, sender=self.user, content=message)
+        future = get_message_writer().submit(msg, track=ack != ACK_AFTER_BROADCAST)
+
+        await self.channel_layer.group_send(subscription.group_name, self.message_event(msg))
+
+        if future is None:
+            await self.send_frame({"type": "ack", "thread_id": msg.thread_id, "uid": str(msg.uid)})
+            return
+
+        task = asyncio.create_task(self.ack_after_flush(msg, future))
+        self.ack_tasks.add(task)
+        task.add_done_callback(self.ack_tasks.discard)
+
+    async def ack_after_flush(self, msg, future):
         try:
-            access_token = AccessToken(token_key)
-            user_id = access_token["user_id"]
-            return User.objects.get(id=user_id)
+            await future
         except Exception:
-            return None
+            await self.send_frame({
+                "type": "error",
+                "thread_id": msg.thread_id,
+                "uid": str(msg.uid),
+                "message": "The message could not be saved.",
+            })
+        else:
+            await self.send_frame({
+                "type": "ack",
+                "thread_id": msg.thread_id,
+                "uid": str(msg.uid),
+                "id": msg.pk,
+                "seq": msg.seq,
+            })
+
+    def message_event(self, msg):
+        """A ``chat.message`` event carrying the frame pre-encoded for every codec."""
+        frame = message_frame(msg, self.user.username)
+        return {
+            "type": "chat.message",
+            "thread_id": msg.thread_id,
+            "uid": str(msg.uid),
+            "seq": msg.seq,
+            "frames": encode_broadcast(frame),
+        }
+
+    # --- Resume ---
+
+    async def replay(self, subscription, last_seq):
+        """
+        Send the messages of a thread after ``last_seq`` before live delivery
+        resumes. Gaps longer than ``CHAT_REPLAY_LIMIT`` are not replayed; the
+        client is told to refetch the history with a ``resync`` frame instead.
+
+        Write-behind messages this process has not committed yet follow the
+        stored ones. They are collected first, so one committed meanwhile is
+        found by the query and dropped from them by uid.
+        """
+        limit = settings.CHAT_REPLAY_LIMIT
+        queued = queued_messages(subscription.thread.id)
+        missed = await self.missed_messages(subscription.thread, last_seq, limit + 1)
+        stored = {msg.uid for msg in missed}
+        pending = [msg for msg in queued if msg.uid not in stored]
+        if len(missed) + len(pending) > limit:
+            await self.send_frame({"type": "resync", "thread_id": subscription.thread.id, "last_seq": last_seq})
+            return
+        for msg in missed + pending:
+            sender = self.user if msg.sender_id == self.user.id else subscription.receiver
+            await self.send_frame(message_frame(msg, sender.username))
+        if missed:
+            subscription.replayed_seq = missed[-1].seq
+        subscription.replayed_uids = {str(msg.uid) for msg in queued}
+
+    # --- Read receipts ---
 
-    @database_sync_to_async
-    def user_in_thread(self):
+    def receive_read(self, subscription, data):
+        """Keep only the highest message id per thread; flush_reads_later() saves them."""
         try:
-            thread = Thread.objects.get(id=self.thread_id)
-            return thread.user1 == self.user or thread.user2 == self.user
-        except Thread.DoesNotExist:
+            message_id = int(data["message_id"])
+        except (KeyError, TypeError, ValueError):
+            return
+        thread_id = subscription.thread.id
+        if message_id > self.pending_reads.get(thread_id, 0):
+            self.pending_reads[thread_id] = message_id
+        if self.read_flush_task is None or self.read_flush_task.done():
+            self.read_flush_task = asyncio.create_task(self.flush_reads_later())
+
+    async def flush_reads_later(self):
+        loop = asyncio.get_running_loop()
+        while self.pending_reads:
+            delay = self.last_read_flush + settings.CHAT_READ_RECEIPT_INTERVAL - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.flush_reads()
+
+    async def flush_reads(self):
+        reads, self.pending_reads = self.pending_reads, {}
+        if not reads:
+            return
+        self.last_read_flush = asyncio.get_running_loop().time()
+        for thread_id, message_id in await self.save_reads(reads):
+            await self.channel_layer.group_send(
+                thread_group_name(thread_id), read_event(thread_id, self.user, message_id)
+            )
+
+    # --- Typing and presence ---
+
+    def allow_ephemeral(self, kind, key=None):
+        """At most one frame of each ephemeral kind (per thread) per configured interval; extras are dropped."""
+        now = asyncio.get_running_loop().time()
+        interval = settings.CHAT_EPHEMERAL_MIN_INTERVAL.get(kind, 0)
+        if now - self.last_ephemeral.get((kind, key), float("-inf")) < interval:
             return False
+        self.last_ephemeral[(kind, key)] = now
+        return True
+
+    async def receive_ephemeral(self, kind, subscription, data=None):
+        if kind == "typing":
+            state = "start" if data.get("state") != "stop" else "stop"
+            # Stops always go through so indicators never get stuck on
+            if state == "start" and not self.allow_ephemeral(kind, subscription.thread.id):
+                return
+            await self.channel_layer.group_send(subscription.group_name, {
+                "type": "chat.typing",
+                "thread_id": subscription.thread.id,
+                "user_id": self.user.id,
+                "user": self.user.username,
+                "state": state,
+            })
+        elif not self.allow_ephemeral(kind):
+            return
+        elif kind == "heartbeat":
+            if await get_presence_store().add(self.user.id, self.channel_name, presence_ttl()):
+                await self.broadcast_presence("online")
+        elif kind == "presence":
+            online = await get_presence_store().online(await self.get_friend_ids())
+            await self.send_frame({"type": "presence", "online": sorted(online)})
+
+    async def broadcast_presence(self, state):
+        event = {"type": "presence.changed", "user_id": self.user.id, "user": self.user.username, "state": state}
+        for friend_id in await self.get_friend_ids():
+            await self.channel_layer.group_send(user_group_name(friend_id), event)
+
+    # --- Channel layer events ---
+
+    async def chat_message(self, event):
+        subscription = self.subscriptions.get(event["thread_id"])
+        if subscription is not None and (
+            (event["seq"] is not None and event["seq"] <= subscription.replayed_seq)
+            or event["uid"] in subscription.replayed_uids
+        ):
+            return  # already replayed
+        await self.push(event["frames"][self.codec.name])
+
+    async def chat_persisted(self, event):
+        await self.send_frame({"type": "persisted", "thread_id": event["thread_id"], "messages": event["messages"]})
+
+    async def chat_read(self, event):
+        # Only the newest cursor of a reader matters, so a backlog keeps one per thread
+        await self.send_frame({
+            "type": "read",
+            "thread_id": event["thread_id"],
+            "user_id": event["user_id"],
+            "user": event["user"],
+            "message_id": event["message_id"],
+        }, key=("read", event["thread_id"], event["user_id"]))
+
+    async def chat_typing(self, event):
+        if event["user_id"] != self.user.id:
+            await self.send_frame({
+                "type": "typing",
+                "thread_id": event["thread_id"],
+                "user_id": event["user_id"],
+                "user": event["user"],
+                "state": event["state"],
+            }, ephemeral=True, key=("typing", event["thread_id"], event["user_id"]))
+
+    async def presence_changed(self, event):
+        await self.send_frame({
+            "type": "presence",
+            "user_id": event["user_id"],
+            "user": event["user"],
+            "state": event["state"],
+        }, ephemeral=True, key=("presence", event["user_id"]))
+
+    async def friendship_changed(self, event):
+        """Drop the cached friend ids; they are re-read when next needed."""
+        self.friend_ids = None
+        if self.multiplexed:
+            await self.send_frame({"type": "friendship", "user_ids": event["user_ids"]})
+
+    async def thread_created(self, event):
+        if self.multiplexed:
+            await self.send_frame({"type": "thread_created", "thread": event["thread"]})
+
+    async def friend_request_received(self, event):
+        if self.multiplexed:
+            await self.send_frame({"type": "friend_request", "request": event["request"]})
+
+    async def thread_deleted(self, event):
+        await self.unsubscribe([event["thread_id"]])
+        await self.send_frame({"type": "thread_deleted", "thread_id": event["thread_id"]})
+
+    # --- Database ---
+
+    def fetch_friend_ids(self):
+        return set(friends.friend_ids(self.user.id))
+
+    async def get_friend_ids(self):
+        if self.friend_ids is None:
+            if use_async_orm():
+                self.friend_ids = set(await friends.afriend_ids(self.user.id))
+            else:
+                self.friend_ids = await database_task(self.fetch_friend_ids, shed=False)()
+        return self.friend_ids
 
-    @database_sync_to_async
-    def create_message(self, message):
-        thread = Thread.objects.get(id=self.thread_id)
-        receiver = thread.user2 if thread.user1 == self.user else thread.user1
+    def participant_threads(self, thread_ids):
+        return Thread.objects.filter(
+            Q(user1=self.user) | Q(user2=self.user), id__in=thread_ids
+        ).select_related("user1", "user2")
 
-        # Check friendship
-        is_friend = Friendship.objects.filter(
-            (Q(user=self.user, friend=receiver) | Q(user=receiver, friend=self.user))
-        ).exists()
+    async def load_subscriptions(self, thread_ids):
+        """Authorize a batch of threads with one query."""
+        if not thread_ids:
+            return []
+        if not use_async_orm():
+            return await self.fetch_subscriptions(thread_ids)
+        subscriptions = [Subscription(thread, self.user) async for thread in self.participant_threads(thread_ids)]
+        await self.get_friend_ids()
+        return subscriptions
 
-        # Enforce message limit for non-friends
-        if not is_friend:
-            count = Message.objects.filter(thread=thread).count()
-            if count >= 20:
+    @database_task
+    def fetch_subscriptions(self, thread_ids):
+        subscriptions = [Subscription(thread, self.user) for thread in self.participant_threads(thread_ids)]
+        if self.friend_ids is None:
+            self.friend_ids = self.fetch_friend_ids()
+        return subscriptions
+
+    async def missed_messages(self, thread, last_seq, limit):
+        if not use_async_orm():
+            return await self.fetch_missed_messages(thread, last_seq, limit)
+        return [msg async for msg in thread.messages.filter(seq__gt=last_seq).order_by("seq")[:limit]]
+
+    @database_task
+    def fetch_missed_messages(self, thread, last_seq, limit):
+        return list(thread.messages.filter(seq__gt=last_seq).order_by("seq")[:limit])
+
+    @database_task(shed=False)
+    def save_reads(self, reads):
+        """Advance the cursors in ``reads``; returns the (thread_id, message_id) pairs that moved."""
+        moved = []
+        for thread_id, message_id in reads.items():
+            subscription = self.subscriptions.get(thread_id)
+            if subscription is not None and ReadReceipt.advance(subscription.thread, self.user, message_id):
+                moved.append((thread_id, message_id))
+        return moved
+
+    @database_task
+    def create_message(self, subscription, message):
+        # One executor call in either mode: the counter update and insert
+        # need a transaction, which Django does not support in async code
+        if self.friend_ids is None:
+            self.friend_ids = self.fetch_friend_ids()
+
+        # Enforce message limit for non-friends against the thread counter
+        thread = subscription.thread
+        msg = Message(thread=thread, sender=self.user, content=message)
+        with transaction.atomic():
+            if not thread.add_message(msg, limit=None if self.is_friend(subscription) else NON_FRIEND_MESSAGE_LIMIT):
                 return None  # stop here
+            msg.save(force_insert=True)
+            recent.write_through([msg])
+        return self.message_event(msg)
+
+
+class ChatConsumer(BaseChatConsumer):
+    """One socket per thread, at ``ws/chat/<thread_id>/``."""
+
+    async def authorize(self):
+        self.default_thread_id = int(self.scope["url_route"]["kwargs"]["thread_id"])
+        joined, _ = await self.subscribe([self.default_thread_id])
+        if joined:
+            # ?last_seq=<n> resumes after the last message the client has
+            last_seq = parse_qs(self.scope.get("query_string", b"").decode()).get("last_seq")
+            if last_seq and last_seq[0].isdigit():
+                self.resume_from[self.default_thread_id] = int(last_seq[0])
+        return bool(joined)
+
+    async def thread_deleted(self, event):
+        # Deletions of the user's other threads arrive on the user group too
+        if event["thread_id"] == self.default_thread_id:
+            await self.close()
+
+
+class UserChatConsumer(BaseChatConsumer):
+    """
+    One socket per user, at ``ws/chat/``. Threads are joined with
+    ``{"type": "subscribe", "thread_ids": [...]}``; new threads, friend
+    requests and friendship changes arrive without subscribing.
+    """
 
-        msg = Message.objects.create(thread=thread, sender=self.user, content=message)
-        return {"message": msg.content, "sender": self.user.username}
+    multiplexed = True
@@ -0,0 +1,78 @@
+"""
+Server-side events pushed to connected consumers over the channel layer.
+
+Consumers cache per-connection state (thread participants, friendship
+status); these helpers tell them when that state goes stale.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+
+def user_group_name(user_id):
+    return f"user_{user_id}"
+
+
+def thread_group_name(thread_id):
+    return f"chat_{thread_id}"
+
+
+def group_send(group, event):
+    channel_layer = get_channel_layer()
+    if channel_layer is not None:
+        async_to_sync(channel_layer.group_send)(group, event)
+
+
+def notify_friendship_changed(user_a, user_b):
+    """Tell both users' connections that the pair's friendship status changed."""
+    event = {"type": "friendship.changed", "user_ids": [user_a.id, user_b.id]}
+    for user in (user_a, user_b):
+        group_send(user_group_name(user.id), event)
+
+
+def notify_thread_deleted(thread_id, user_ids):
+    """Tell the participants' connections that the thread is gone, subscribed to it or not."""
+    for user_id in user_ids:
+        group_send(user_group_name(user_id), {"type": "thread.deleted", "thread_id": thread_id})
+
+
+def notify_thread_created(thread):
+    """Tell both participants' connections about a new thread, each with the other user."""
+    for user, other in ((thread.user1, thread.user2), (thread.user2, thread.user1)):
+        group_send(user_group_name(user.id), {
+            "type": "thread.created",
+            "thread": {"id": thread.id, "other_user": {"id": other.id, "username": other.username}},
+        })
+
+
+def notify_friend_request(friend_request):
+    group_send(user_group_name(friend_request.to_user_id), {
+        "type": "friend_request.received",
+        "request": {
+            "id": friend_request.id,
+            "from_user": {"id": friend_request.from_user.id, "username": friend_request.from_user.username},
+            "created_at": friend_request.created_at.isoformat(),
+        },
+    })
+
+
+def read_event(thread_id, user, message_id):
+    return {
+        "type": "chat.read",
+        "thread_id": thread_id,
+        "user_id": user.id,
+        "user": user.username,
+        "message_id": message_id,
+    }
+
+
+def persisted_event(thread_id, messages):
+    """Ids and seqs of write-behind ``messages`` of one thread, once they are committed."""
+    return {
+        "type": "chat.persisted",
+        "thread_id": thread_id,
+        "messages": [{"uid": str(message.uid), "id": message.pk, "seq": message.seq} for message in messages],
+    }
+
+
+def notify_read(thread_id, user, message_id):
+    group_send(thread_group_name(thread_id), read_event(thread_id, user, message_id))
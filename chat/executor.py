@@ -0,0 +1,133 @@
+"""
+Worker threads for the consumers' database calls.
+
+Channels' ``database_sync_to_async`` runs every call on asgiref's shared
+executor, so a burst of slow queries from one path queues everything else
+behind it. Consumer calls go through ``database_task`` instead, which runs
+them on a pool of their own: ``CHAT_DB_EXECUTOR["WORKERS"]`` threads, each
+with its own database connection, and at most ``QUEUE`` calls waiting for
+one. Past that, calls made with ``shed=True`` (the default) raise
+``ServerBusy`` straight away; the consumer answers the frame with
+``server_busy`` rather than letting the backlog grow. Background work that
+must not be dropped (read receipts, write-behind batches) passes
+``shed=False`` and always queues.
+
+Queue depth, rejections, wait and run time are in ``chat.metrics``.
+
+With ``CHAT_ASYNC_ORM`` on, the consumers' read paths (token fallback
+auth, membership, friend ids, replay) use Django's async ORM API
+(``afirst()``, ``async for``) on the event loop instead; see
+``use_async_orm()``. Sending a message always takes one executor call,
+as Django cannot run the transaction that allocates its sequence number
+from async code.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from chat import metrics
+
+DEFAULTS = {
+    # Database calls block on I/O, so allow more threads than cores
+    "WORKERS": min(32, (os.cpu_count() or 1) * 2),
+    "QUEUE": 64,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class ServerBusy(Exception):
+    """Raised instead of queueing a call when the executor's queue is full."""
+
+
+def executor_settings():
+    return {**DEFAULTS, **getattr(settings, "CHAT_DB_EXECUTOR", {})}
+
+
+def use_async_orm():
+    """
+    Whether consumer reads go through Django's async ORM API. Django 5.2's
+    backends are all sync, so each async query still hops to asgiref's
+    thread; ``benchmarks.consumer_orm`` compares the two paths.
+    """
+    return getattr(settings, "CHAT_ASYNC_ORM", False)
+
+
+class DatabaseExecutor:
+    def __init__(self, workers, queue_size):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chat-db")
+        # Calls submitted and not yet finished, running ones included
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    @property
+    def queued(self):
+        return max(0, self.pending - self.workers)
+
+    def submit(self, fn, shed=True):
+        with self.lock:
+            if shed and self.pending >= self.workers + self.queue_size:
+                metrics.db_executor_rejected.inc()
+                raise ServerBusy
+            self.pending += 1
+            metrics.db_executor_queued.set(self.queued)
+        future = self.pool.submit(fn)
+        future.add_done_callback(self.finished)
+        return future
+
+    def finished(self, future):
+        with self.lock:
+            self.pending -= 1
+            metrics.db_executor_queued.set(self.queued)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+def get_database_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            config = executor_settings()
+            _executor = DatabaseExecutor(config["WORKERS"], config["QUEUE"])
+        return _executor
+
+
+def database_task(func=None, *, shed=True):
+    """
+    Like channels' ``database_sync_to_async``, but run on the consumer
+    executor; records wait and run time under ``func``'s name.
+    """
+    if func is None:
+        return functools.partial(database_task, shed=shed)
+    operation = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        queued = time.perf_counter()
+
+        def run():
+            started = time.perf_counter()
+            metrics.db_executor_wait_seconds.observe(started - queued, operation=operation)
+            close_old_connections()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                close_old_connections()
+                metrics.db_call_seconds.observe(time.perf_counter() - started, operation=operation)
+
+        context = contextvars.copy_context()
+        future = get_database_executor().submit(functools.partial(context.run, run), shed)
+        return await asyncio.wrap_future(future)
+
+    return wrapper
@@ -0,0 +1,100 @@
+"""
+Per-user cache of friend ids.
+
+Friendships only change when a request is accepted, so each user's friend
+ids are read once and kept in the ``CHAT_FRIENDS["CACHE"]`` cache alias as
+a sorted array of unsigned 64-bit ints (8 bytes per friend). Membership
+checks bisect the array; ``friends_among()`` answers "which of these users
+are my friends" for a whole batch from one cache read.
+
+Saving or deleting a ``Friendship`` (accepting a request, the admin)
+drops both users' entries once the transaction commits, see
+``chat.signals``; ``QuerySet.update()`` and ``bulk_create()`` bypass that
+and leave them stale until ``TIMEOUT``. Workers only see each other's
+invalidations through a shared cache, so point ``CACHE_REDIS_URL`` at
+Redis when running more than one.
+"""
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULTS = {
+    "CACHE": "default",
+    "TIMEOUT": 3600,
+}
+KEY = "chat:friends:{}"
+TYPECODE = "Q"
+
+# Per-process hit/miss counters, see stats()
+counters = Counter()
+
+
+def friends_settings():
+    return {**DEFAULTS, **getattr(settings, "CHAT_FRIENDS", {})}
+
+
+def stats():
+    lookups = counters["hits"] + counters["misses"]
+    return {**counters, "hit_ratio": counters["hits"] / lookups if lookups else None}
+
+
+def friend_ids(user_id):
+    """The ids of the user's friends as a sorted ``array``."""
+    from chat.models import Friendship
+
+    config = friends_settings()
+    cache = caches[config["CACHE"]]
+    key = KEY.format(user_id)
+    data = cache.get(key)
+    ids = array(TYPECODE)
+    if data is not None:
+        counters["hits"] += 1
+        ids.frombytes(data)
+        return ids
+
+    counters["misses"] += 1
+    ids.extend(sorted(Friendship.friend_ids(user_id)))
+    cache.set(key, ids.tobytes(), config["TIMEOUT"])
+    return ids
+
+
+async def afriend_ids(user_id):
+    """``friend_ids()`` through the async cache and ORM APIs."""
+    from chat.models import Friendship
+
+    config = friends_settings()
+    cache = caches[config["CACHE"]]
+    key = KEY.format(user_id)
+    data = await cache.aget(key)
+    ids = array(TYPECODE)
+    if data is not None:
+        counters["hits"] += 1
+        ids.frombytes(data)
+        return ids
+
+    counters["misses"] += 1
+    ids.extend(sorted([friend_id async for friend_id in Friendship.friend_ids_query(user_id)]))
+    await cache.aset(key, ids.tobytes(), config["TIMEOUT"])
+    return ids
+
+
+def contains(ids, user_id):
+    position = bisect_left(ids, user_id)
+    return position < len(ids) and ids[position] == user_id
+
+
+def friends_among(user_id, user_ids):
+    """The subset of ``user_ids`` that are friends of ``user_id``."""
+    ids = friend_ids(user_id)
+    return {other_id for other_id in user_ids if contains(ids, other_id)}
+
+
+def are_friends(user_id, other_id):
+    return contains(friend_ids(user_id), other_id)
+
+
+def invalidate(*user_ids):
+    caches[friends_settings()["CACHE"]].delete_many([KEY.format(user_id) for user_id in user_ids])
@@ -0,0 +1,67 @@
+"""
+Timing and query counting for the HTTP and WebSocket paths, recorded in
+``chat.metrics``:
+
+* ``QueryMetricsMiddleware`` - per view: requests, latency, number of
+  database queries and time spent in them
+* ``InstrumentedConsumerMixin`` - per consumer: time spent handling each
+  event type (``websocket.connect``, ``websocket.receive``, the
+  ``chat.message`` broadcasts, ...)
+
+Consumer database calls are timed by ``chat.executor.database_task``.
+"""
+import time
+
+from django.db import connection
+
+from chat import metrics
+
+
+class QueryRecorder:
+    """A ``connection.execute_wrapper()`` that counts queries and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class QueryMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        # Route names keep the label set small; unmatched paths share one label
+        match = request.resolver_match
+        view = match.view_name if match is not None else "unmatched"
+        metrics.http_requests.inc(view=view, method=request.method, status=response.status_code)
+        metrics.http_request_seconds.observe(elapsed, view=view)
+        metrics.http_db_queries.observe(recorder.count, view=view)
+        metrics.http_db_seconds.observe(recorder.seconds, view=view)
+        return response
+
+
+class InstrumentedConsumerMixin:
+    """Put before the consumer base class to time every event it handles."""
+
+    async def dispatch(self, message):
+        start = time.perf_counter()
+        try:
+            await super().dispatch(message)
+        finally:
+            metrics.ws_handler_seconds.observe(
+                time.perf_counter() - start, consumer=type(self).__name__, event=message["type"]
+            )
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat.archive import archive_batch, archive_cutoff, archive_settings
+from chat.models import Thread
+
+
+class Command(BaseCommand):
+    help = (
+        "Move messages older than CHAT_ARCHIVE['AGE_DAYS'] into compressed archive segments, "
+        "one short transaction per batch (see chat/archive.py)."
+    )
+
+    def add_arguments(self, parser):
+        config = archive_settings()
+        parser.add_argument("--batch-size", type=int, default=config["BATCH_SIZE"], help="Messages per segment and transaction.")
+        parser.add_argument("--max-batches", type=int, default=0, help="Stop after this many batches (0: no limit).")
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches.")
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff()
+        batch_size = options["batch_size"]
+        max_batches = options["max_batches"]
+        batches = archived = 0
+        last_id = 0
+
+        while not max_batches or batches < max_batches:
+            threads = list(Thread.objects.filter(id__gt=last_id).order_by("id")[:100])
+            if not threads:
+                break
+            for thread in threads:
+                last_id = thread.id
+                while not max_batches or batches < max_batches:
+                    moved = archive_batch(thread, cutoff, batch_size)
+                    if not moved:
+                        break
+                    batches += 1
+                    archived += moved
+                    if options["pause"]:
+                        time.sleep(options["pause"])
+                    if moved < batch_size:
+                        break
+                if max_batches and batches >= max_batches:
+                    break
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} message(s) in {batches} batch(es)."))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from chat.models import Message, MessageArchiveSegment, Thread
+
+
+def counted_messages():
+    """
+    Correlated count of a thread's messages, live and archived, for use
+    against ``Thread`` rows.
+    """
+    counts = (
+        Message.objects.filter(thread=OuterRef("pk"))
+        .order_by()
+        .values("thread")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    archived = (
+        MessageArchiveSegment.objects.filter(thread=OuterRef("pk"))
+        .order_by()
+        .values("thread")
+        .annotate(total=Sum("message_count"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counts), Value(0)) + Coalesce(Subquery(archived), Value(0))
+
+
+class Command(BaseCommand):
+    help = "Recompute Thread.message_count from the messages table, in bounded batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Threads updated per transaction.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        last_id = 0
+        updated = 0
+        while True:
+            ids = list(
+                Thread.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                updated += Thread.objects.filter(id__in=ids).update(message_count=counted_messages())
+            last_id = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled message_count on {updated} thread(s)."))
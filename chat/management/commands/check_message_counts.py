@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+
+from chat.management.commands.backfill_message_counts import counted_messages
+from chat.models import Thread
+
+
+class Command(BaseCommand):
+    help = "Report threads whose message_count differs from their actual number of messages."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="Rewrite drifted counters in place.")
+
+    def handle(self, *args, **options):
+        drifted = (
+            Thread.objects.annotate(actual=counted_messages())
+            .exclude(message_count=F("actual"))
+            .values_list("id", "message_count", "actual")
+        )
+
+        mismatches = 0
+        for thread_id, stored, actual in drifted.iterator():
+            mismatches += 1
+            self.stdout.write(f"Thread {thread_id}: message_count={stored}, actual={actual}")
+            if options["fix"]:
+                Thread.objects.filter(id=thread_id).update(message_count=counted_messages())
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("All thread message counts are consistent."))
+        elif options["fix"]:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {mismatches} thread(s)."))
+        else:
+            raise CommandError(f"{mismatches} thread(s) have an inconsistent message_count.")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from chat.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text message search index (see chat/search.py)."
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if backend is None:
+            raise CommandError(f"Message search is not supported on {connection.vendor}.")
+
+        with connection.cursor() as cursor:
+            for statement in backend.rebuild_sql:
+                cursor.execute(statement)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the {connection.vendor} message search index."))
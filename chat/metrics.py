@@ -0,0 +1,189 @@
+"""
+Process-local metrics in the Prometheus text format.
+
+``Counter``, ``Gauge`` and ``Histogram`` keep their samples in memory, per label set;
+``render()`` writes every registered metric, plus the hit/miss counters
+the caches and outboxes already keep (see ``default_collectors()``), for the
+``/metrics`` endpoint. Each worker process serves its own numbers, so
+scrape every worker rather than a load balancer in front of them.
+"""
+import math
+import threading
+
+# Seconds; covers a cache hit up to a slow page
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+registry = []
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.samples = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def label_values(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            samples = sorted(self.samples.items())
+        for values, sample in samples:
+            lines += self.render_sample(list(zip(self.labelnames, values)), sample)
+        return lines
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.samples.get(self.label_values(labels), 0)
+
+    def render_sample(self, labels, value):
+        return [f"{self.name}_total{format_labels(labels)} {format_value(value)}"]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.samples[key] = value
+
+    def value(self, **labels):
+        return self.samples.get(self.label_values(labels), 0)
+
+    def render_sample(self, labels, value):
+        return [f"{self.name}{format_labels(labels)} {format_value(value)}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            sample = self.samples.get(key)
+            if sample is None:
+                # [count per bucket..., sum]; buckets are made cumulative when rendered
+                sample = self.samples[key] = [0] * len(self.buckets) + [0.0]
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample[position] += 1
+                    break
+            sample[-1] += value
+
+    def count(self, **labels):
+        sample = self.samples.get(self.label_values(labels))
+        return sum(sample[:-1]) if sample else 0
+
+    def render_sample(self, labels, sample):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, sample):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{format_labels(labels + [('le', format_value(bound))])} {cumulative}")
+        lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(sample[-1])}")
+        lines.append(f"{self.name}_count{format_labels(labels)} {cumulative}")
+        return lines
+
+
+http_requests = Counter(
+    "chat_http_requests", "HTTP requests by view, method and status.", ("view", "method", "status")
+)
+http_request_seconds = Histogram(
+    "chat_http_request_seconds", "Time spent handling HTTP requests, per view.", ("view",)
+)
+http_db_queries = Histogram(
+    "chat_http_db_queries", "Database queries per HTTP request, per view.", ("view",), QUERY_COUNT_BUCKETS
+)
+http_db_seconds = Histogram(
+    "chat_http_db_seconds", "Time spent in database queries per HTTP request, per view.", ("view",)
+)
+ws_handler_seconds = Histogram(
+    "chat_ws_handler_seconds", "Time consumers spend handling an event, per consumer and event type.",
+    ("consumer", "event"),
+)
+db_executor_wait_seconds = Histogram(
+    "chat_db_executor_wait_seconds", "Time consumer database calls wait for a worker thread.", ("operation",)
+)
+db_executor_queued = Gauge(
+    "chat_db_executor_queued", "Consumer database calls waiting for a worker thread."
+)
+db_executor_rejected = Counter(
+    "chat_db_executor_rejected", "Consumer database calls refused because the queue was full."
+)
+db_call_seconds = Histogram(
+    "chat_db_call_seconds", "Time consumer database calls take once running.", ("operation",)
+)
+
+
+def stats_collector(name, documentation, stats):
+    """Expose a module's ``stats()`` counters as one counter labelled by ``event``."""
+
+    def collect():
+        lines = [f"# HELP {name} {documentation}", f"# TYPE {name} counter"]
+        for event, value in sorted(stats().items()):
+            if isinstance(value, int):
+                lines.append(f"{name}_total{format_labels([('event', event)])} {value}")
+        return lines
+
+    return collect
+
+
+def default_collectors():
+    from chat import friends, outbox, recent
+
+    return [
+        stats_collector("chat_recent_cache", "Recent-messages cache lookups and writes.", recent.stats),
+        stats_collector("chat_friend_cache", "Friend-id cache lookups.", friends.stats),
+        stats_collector("chat_outbox_frames", "Outbound WebSocket frames by outcome.", outbox.stats),
+    ]
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines += metric.render()
+    for collect in default_collectors():
+        lines += collect()
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_message_count(apps, schema_editor):
+    Thread = apps.get_model("chat", "Thread")
+    Message = apps.get_model("chat", "Message")
+    counts = (
+        Message.objects.filter(thread=OuterRef("pk"))
+        .order_by()
+        .values("thread")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    Thread.objects.update(message_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_message_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thread',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_message_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+import uuid
+
+from django.db import migrations, models
+
+
+def populate_uid(apps, schema_editor):
+    Message = apps.get_model("chat", "Message")
+    batch = []
+    for message in Message.objects.only("id").iterator(chunk_size=2000):
+        message.uid = uuid.uuid4()
+        batch.append(message)
+        if len(batch) >= 2000:
+            Message.objects.bulk_update(batch, ["uid"])
+            batch = []
+    if batch:
+        Message.objects.bulk_update(batch, ["uid"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_thread_message_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='uid',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(populate_uid, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='message',
+            name='uid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+    ]
@@ -0,0 +1,62 @@
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_seq(apps, schema_editor):
+    """Number each thread's messages 1..n in history order and record n on the thread."""
+    Thread = apps.get_model("chat", "Thread")
+    Message = apps.get_model("chat", "Message")
+    batch = []
+    thread_id, seq = None, 0
+    messages = Message.objects.only("id", "thread_id").order_by("thread_id", "timestamp", "id")
+    for message in messages.iterator(chunk_size=2000):
+        if message.thread_id != thread_id:
+            thread_id, seq = message.thread_id, 0
+        seq += 1
+        message.seq = seq
+        batch.append(message)
+        if len(batch) >= 2000:
+            Message.objects.bulk_update(batch, ["seq"])
+            batch = []
+    if batch:
+        Message.objects.bulk_update(batch, ["seq"])
+
+    last_seq = (
+        Message.objects.filter(thread=OuterRef("pk"))
+        .order_by()
+        .values("thread")
+        .annotate(last=Max("seq"))
+        .values("last")
+    )
+    Thread.objects.update(last_seq=Coalesce(Subquery(last_seq), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_read_receipt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thread',
+            name='last_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(populate_seq, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(editable=False),
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('thread', 'seq'), name='chat_msg_thread_seq_uniq'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+from chat.search import get_search_backend
+
+
+def install_search_index(apps, schema_editor):
+    backend = get_search_backend(schema_editor.connection.vendor)
+    if backend is not None:
+        for statement in backend.rebuild_sql:
+            schema_editor.execute(statement)
+
+
+def uninstall_search_index(apps, schema_editor):
+    backend = get_search_backend(schema_editor.connection.vendor)
+    if backend is not None:
+        for statement in backend.uninstall_sql:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_message_seq'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_message_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_timestamp', models.DateTimeField()),
+                ('first_message_id', models.PositiveBigIntegerField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('last_message_id', models.PositiveBigIntegerField()),
+                ('min_message_id', models.PositiveBigIntegerField()),
+                ('max_message_id', models.PositiveBigIntegerField()),
+                ('message_count', models.PositiveIntegerField()),
+                ('codec', models.CharField(max_length=16)),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('thread', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archive_segments', to='chat.thread')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['thread', 'last_timestamp', 'last_message_id'], name='chat_archive_thread_last_idx')],
+            },
+        ),
+    ]
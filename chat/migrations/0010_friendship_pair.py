@@ -0,0 +1,100 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def merge_pairs(apps, schema_editor):
+    """Fold each pair's reciprocal (user, friend) rows into one row ordered low/high, keeping the oldest."""
+    Friendship = apps.get_model("chat", "Friendship")
+    seen = set()
+    batch, duplicates = [], []
+    for friendship in Friendship.objects.order_by("created_at", "id").iterator(chunk_size=2000):
+        pair = tuple(sorted((friendship.user_id, friendship.friend_id)))
+        if pair in seen or pair[0] == pair[1]:
+            duplicates.append(friendship.id)
+            continue
+        seen.add(pair)
+        friendship.user_low_id, friendship.user_high_id = pair
+        batch.append(friendship)
+        if len(batch) >= 2000:
+            Friendship.objects.bulk_update(batch, ["user_low", "user_high"])
+            batch = []
+    if batch:
+        Friendship.objects.bulk_update(batch, ["user_low", "user_high"])
+    for start in range(0, len(duplicates), 2000):
+        Friendship.objects.filter(id__in=duplicates[start:start + 2000]).delete()
+
+
+def split_pairs(apps, schema_editor):
+    """Restore a (user, friend) row in each direction."""
+    Friendship = apps.get_model("chat", "Friendship")
+    for friendship in Friendship.objects.filter(user__isnull=True).iterator(chunk_size=2000):
+        Friendship.objects.filter(id=friendship.id).update(
+            user_id=friendship.user_low_id, friend_id=friendship.user_high_id
+        )
+        mirror = Friendship.objects.create(user_id=friendship.user_high_id, friend_id=friendship.user_low_id)
+        # created_at is auto_now_add; carry the original over
+        Friendship.objects.filter(id=mirror.id).update(created_at=friendship.created_at)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_message_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='friendship',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='friendship',
+            name='user_low',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='friendships_low', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='friendship',
+            name='user_high',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='friendships_high', to=settings.AUTH_USER_MODEL),
+        ),
+        # Nullable while rows are merged, so the migration can also run backwards
+        migrations.AlterField(
+            model_name='friendship',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='friendships', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='friendship',
+            name='friend',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='related_to_friendships', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(merge_pairs, split_pairs),
+        migrations.RemoveField(
+            model_name='friendship',
+            name='friend',
+        ),
+        migrations.RemoveField(
+            model_name='friendship',
+            name='user',
+        ),
+        migrations.AlterField(
+            model_name='friendship',
+            name='user_low',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friendships_low', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='friendship',
+            name='user_high',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friendships_high', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='friendship',
+            constraint=models.UniqueConstraint(fields=('user_low', 'user_high'), name='chat_friendship_pair_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='friendship',
+            constraint=models.CheckConstraint(condition=models.Q(('user_low__lt', models.F('user_high'))), name='chat_friendship_pair_order'),
+        ),
+    ]
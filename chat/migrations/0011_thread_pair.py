@@ -0,0 +1,118 @@
+import json
+import uuid
+import zlib
+from datetime import datetime
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def restore_archive(apps, thread):
+    """
+    Move ``thread``'s archived messages back into ``Message``. Segments store
+    each message's seq, so they cannot follow a renumbering; the
+    ``archive_messages`` command archives the merged history again.
+    """
+    Message = apps.get_model("chat", "Message")
+    MessageArchiveSegment = apps.get_model("chat", "MessageArchiveSegment")
+
+    segments = MessageArchiveSegment.objects.filter(thread_id=thread.id)
+    restored = []
+    for segment in segments:
+        # The format of chat.archive.pack(), which may change after this migration
+        if segment.codec != "zlib":
+            raise ValueError(f"Unknown archive codec {segment.codec!r}")
+        for message_id, uid, seq, sender_id, content, timestamp in json.loads(zlib.decompress(segment.data)):
+            restored.append(Message(
+                id=message_id,
+                uid=uuid.UUID(uid),
+                seq=seq,
+                thread_id=thread.id,
+                sender_id=sender_id,
+                content=content,
+                timestamp=datetime.fromisoformat(timestamp),
+            ))
+    Message.objects.bulk_create(restored, batch_size=2000)
+    segments.delete()
+
+
+def merge_thread(apps, keep, duplicate):
+    """Move ``duplicate``'s messages, archive and read receipts into ``keep`` and delete it."""
+    Message = apps.get_model("chat", "Message")
+    ReadReceipt = apps.get_model("chat", "ReadReceipt")
+    Thread = apps.get_model("chat", "Thread")
+
+    restore_archive(apps, keep)
+    restore_archive(apps, duplicate)
+
+    # Renumber the merged history 1..n in history order. Every step shifts
+    # seqs past the current maximum first so that (thread, seq) stays unique
+    # row by row.
+    top = max(
+        Message.objects.filter(thread_id__in=(keep.id, duplicate.id)).aggregate(top=Max("seq"))["top"] or 0,
+        keep.last_seq,
+        duplicate.last_seq,
+    )
+    Message.objects.filter(thread_id=duplicate.id).update(thread_id=keep.id, seq=F("seq") + top)
+    messages = list(Message.objects.filter(thread_id=keep.id).only("id", "timestamp").order_by("timestamp", "id"))
+    Message.objects.filter(thread_id=keep.id).update(seq=F("seq") + 2 * top + len(messages) + 1)
+    for position, message in enumerate(messages):
+        message.seq = position + 1
+    Message.objects.bulk_update(messages, ["seq"], batch_size=2000)
+
+    for receipt in ReadReceipt.objects.filter(thread_id=duplicate.id):
+        existing = ReadReceipt.objects.filter(thread_id=keep.id, user_id=receipt.user_id).first()
+        if existing is None:
+            ReadReceipt.objects.filter(pk=receipt.pk).update(thread_id=keep.id)
+        elif receipt.last_read_message_id > existing.last_read_message_id:
+            ReadReceipt.objects.filter(pk=existing.pk).update(last_read_message_id=receipt.last_read_message_id)
+
+    unread = {
+        keep.user1_id: keep.user1_unread_count,
+        keep.user2_id: keep.user2_unread_count,
+    }
+    unread[duplicate.user1_id] += duplicate.user1_unread_count
+    unread[duplicate.user2_id] += duplicate.user2_unread_count
+    last = messages[-1] if messages else None
+    Thread.objects.filter(pk=keep.pk).update(
+        message_count=keep.message_count + duplicate.message_count,
+        last_seq=len(messages),
+        last_message_id=last.id if last else None,
+        last_activity_at=max(keep.last_activity_at, duplicate.last_activity_at),
+        user1_unread_count=unread[keep.user1_id],
+        user2_unread_count=unread[keep.user2_id],
+    )
+    Thread.objects.filter(pk=duplicate.pk).delete()
+
+
+def canonicalize_threads(apps, schema_editor):
+    """Store every pair with ``user1_id < user2_id``, merging a pair's threads into its oldest."""
+    Thread = apps.get_model("chat", "Thread")
+    for thread in Thread.objects.filter(user1_id__gt=F("user2_id")).order_by("id"):
+        other = Thread.objects.filter(user1_id=thread.user2_id, user2_id=thread.user1_id).first()
+        if other is not None:
+            keep, duplicate = sorted((thread, other), key=lambda t: (t.created_at, t.id))
+            merge_thread(apps, keep, duplicate)
+            if keep.id == other.id:
+                continue
+        Thread.objects.filter(pk=thread.pk).update(
+            user1_id=thread.user2_id,
+            user2_id=thread.user1_id,
+            user1_unread_count=F("user2_unread_count"),
+            user2_unread_count=F("user1_unread_count"),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_friendship_pair'),
+    ]
+
+    operations = [
+        migrations.RunPython(canonicalize_threads, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='thread',
+            constraint=models.CheckConstraint(condition=models.Q(('user1__lt', models.F('user2'))), name='chat_thread_pair_order'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def point_at_uids(apps, schema_editor):
+    Message = apps.get_model("chat", "Message")
+    Thread = apps.get_model("chat", "Thread")
+    Thread.objects.filter(previous_last_message__isnull=False).update(
+        last_message=Subquery(Message.objects.filter(pk=OuterRef("previous_last_message")).values("uid")[:1])
+    )
+
+
+def point_at_ids(apps, schema_editor):
+    Message = apps.get_model("chat", "Message")
+    Thread = apps.get_model("chat", "Thread")
+    Thread.objects.filter(last_message__isnull=False).update(
+        previous_last_message=Subquery(Message.objects.filter(uid=OuterRef("last_message")).values("pk")[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_thread_pair'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='thread',
+            old_name='last_message',
+            new_name='previous_last_message',
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message', to_field='uid'),
+        ),
+        migrations.RunPython(point_at_uids, point_at_ids),
+        migrations.RemoveField(
+            model_name='thread',
+            name='previous_last_message',
+        ),
+    ]
@@ -1,9 +1,22 @@
-from django.db import models
+import uuid
+
+from django.db import connections, models, router, transaction
+from django.db.models import Case, F, Max, Q, When
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 
 User = get_user_model()
 
+# Messages a thread may hold while its participants are not friends.
+NON_FRIEND_MESSAGE_LIMIT = 20
+
+
+def can_update_returning(connection):
+    """Whether ``connection`` takes ``UPDATE ... RETURNING`` (PostgreSQL, SQLite 3.35+)."""
+    if connection.vendor == "postgresql":
+        return True
+    return connection.vendor == "sqlite" and connection.Database.sqlite_version_info >= (3, 35)
+
 
 class FriendRequest(models.Model):
     from_user = models.ForeignKey(
@@ -21,29 +34,70 @@ class FriendRequest(models.Model):
     def __str__(self):
         return f"{self.from_user} → {self.to_user} ({'accepted' if self.accepted else 'pending'})"
 
+    def accept(self):
+        """
+        Accept the request and befriend the pair in one transaction, settling
+        a pending request in the other direction too. Returns False when the
+        request had already been accepted.
+        """
+        with transaction.atomic():
+            accepted = FriendRequest.objects.filter(pk=self.pk, accepted=False).update(accepted=True)
+            FriendRequest.objects.filter(
+                from_user_id=self.to_user_id, to_user_id=self.from_user_id, accepted=False
+            ).update(accepted=True)
+            Friendship.befriend(self.from_user_id, self.to_user_id)
+        self.accepted = True
+        return bool(accepted)
+
 
 class Friendship(models.Model):
-    user = models.ForeignKey(User, related_name="friendships", on_delete=models.CASCADE)
-    friend = models.ForeignKey(
-        User, related_name="related_to_friendships", on_delete=models.CASCADE
-    )
+    """A pair of friends, stored once with ``user_low_id < user_high_id``."""
+
+    user_low = models.ForeignKey(User, related_name="friendships_low", on_delete=models.CASCADE)
+    user_high = models.ForeignKey(User, related_name="friendships_high", on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        unique_together = ("user", "friend")
+        constraints = [
+            models.UniqueConstraint(fields=("user_low", "user_high"), name="chat_friendship_pair_uniq"),
+            models.CheckConstraint(condition=Q(user_low__lt=F("user_high")), name="chat_friendship_pair_order"),
+        ]
 
     def __str__(self):
-        return f"{self.user} ↔ {self.friend}"
+        return f"{self.user_low} ↔ {self.user_high}"
+
+    @staticmethod
+    def pair(user_a_id, user_b_id):
+        """``user_low``/``user_high`` lookup kwargs for the pair."""
+        low, high = sorted((user_a_id, user_b_id))
+        return {"user_low_id": low, "user_high_id": high}
+
+    @classmethod
+    def befriend(cls, user_a_id, user_b_id):
+        """The pair's friendship, created if needed; returns (friendship, created)."""
+        return cls.objects.get_or_create(**cls.pair(user_a_id, user_b_id))
+
+    @classmethod
+    def friend_ids(cls, user_id):
+        """Ids of the user's friends, from the database; see ``chat.friends`` for the cached ones."""
+        return list(cls.friend_ids_query(user_id))
+
+    @classmethod
+    def friend_ids_query(cls, user_id):
+        """A flat ``values_list`` of the user's friend ids, whichever side of the pair they are on."""
+        return cls.objects.filter(Q(user_low_id=user_id) | Q(user_high_id=user_id)).annotate(
+            friend_id=Case(When(user_low_id=user_id, then=F("user_high_id")), default=F("user_low_id"))
+        ).values_list("friend_id", flat=True)
 
     @staticmethod
     def are_friends(user1, user2) -> bool:
-        return Friendship.objects.filter(
-            user=user1, friend=user2
-        ).exists() or Friendship.objects.filter(user=user2, friend=user1).exists()
+        from chat import friends
+
+        return friends.are_friends(user1.pk, user2.pk)
 
 
 class Thread(models.Model):
-    """Represents a one-on-one chat thread between two users"""
+    """Represents a one-on-one chat thread between two users, stored with ``user1_id < user2_id``"""
 
     user1 = models.ForeignKey(
         User, related_name="thread_user1", on_delete=models.CASCADE
@@ -52,13 +106,44 @@ class Thread(models.Model):
         User, related_name="thread_user2", on_delete=models.CASCADE
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized COUNT(*) of messages, kept in step by add_message().
+    message_count = models.PositiveIntegerField(default=0)
+    # Inbox preview, kept in step by add_message(). Keyed by uid, which is
+    # known before the INSERT, so the same UPDATE that allocates the seq
+    # can set it; the constraint is only checked at commit.
+    last_message = models.ForeignKey(
+        "Message", to_field="uid", related_name="+", null=True, blank=True, on_delete=models.SET_NULL
+    )
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    user1_unread_count = models.PositiveIntegerField(default=0)
+    user2_unread_count = models.PositiveIntegerField(default=0)
+    # Highest Message.seq handed out in this thread; only ever grows
+    last_seq = models.PositiveBigIntegerField(default=0)
 
     class Meta:
+        # With the pair ordered, one unique index covers both directions
         unique_together = ("user1", "user2")
+        constraints = [
+            models.CheckConstraint(condition=Q(user1__lt=F("user2")), name="chat_thread_pair_order"),
+        ]
+        indexes = [
+            # Back the per-user inbox, ordered by recent activity
+            models.Index(fields=["user1", "last_activity_at", "id"], name="chat_thread_user1_activity_idx"),
+            models.Index(fields=["user2", "last_activity_at", "id"], name="chat_thread_user2_activity_idx"),
+        ]
 
     def __str__(self):
         return f"Thread: {self.user1} & {self.user2}"
 
+    @classmethod
+    def open(cls, user_a, user_b):
+        """
+        The pair's thread, created if needed; returns (thread, created). The
+        unique pair index makes this safe against concurrent calls.
+        """
+        user1, user2 = sorted((user_a, user_b), key=lambda user: user.pk)
+        return cls.objects.select_related("user1", "user2").get_or_create(user1=user1, user2=user2)
+
     def participants(self):
         return [self.user1, self.user2]
 
@@ -72,27 +157,229 @@ class Thread(models.Model):
             return self.user1
         return None
 
+    def add_message(self, message, limit=None):
+        """
+        Make room for the unsaved ``message``: allocate its sequence number
+        (set on it), bump ``message_count`` and point the inbox preview at
+        it, all in the one UPDATE. With ``limit`` set the row is only updated
+        while the count is below it, so concurrent senders cannot overshoot
+        it; False is returned once it is reached. Call inside the
+        transaction that then inserts the message.
+        """
+        return self.add_messages([message], limit)
+
+    def add_messages(self, messages, limit=None):
+        """
+        ``add_message()`` for several unsaved ``messages`` of this thread,
+        numbered consecutively in list order.
+
+        Where the database supports it this is a single ``UPDATE ...
+        RETURNING last_seq``; elsewhere ``allocate_seqs()`` locks the row
+        and reads it first.
+        """
+        count = len(messages)
+        connection = connections[router.db_for_write(Thread, instance=self)]
+        if can_update_returning(connection):
+            sql, params = self.add_messages_sql(connection, messages, limit)
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+            first_seq = None if row is None else row[0] - count + 1
+        else:
+            first_seq = self.allocate_seqs(
+                count, limit, message_count=F("message_count") + count, **self.inbox_changes(messages)
+            )
+        if first_seq is None:
+            return False
+        for offset, message in enumerate(messages):
+            message.seq = first_seq + offset
+        return True
+
+    def add_messages_sql(self, connection, messages, limit):
+        """The ``UPDATE ... RETURNING`` statement of ``add_messages()`` and its params."""
+        count = len(messages)
+        last, unread = self.inbox_counts(messages)
+        # (field, value, whether it is added to the current value)
+        changes = [
+            ("last_seq", count, True),
+            ("message_count", count, True),
+            ("last_message", last.uid, False),
+            ("last_activity_at", last.timestamp, False),
+        ]
+        changes += [(field, received, not replied) for field, (received, replied) in unread.items()]
+
+        quote = connection.ops.quote_name
+        opts = Thread._meta
+        assignments, params = [], []
+        for name, value, increment in changes:
+            field = opts.get_field(name)
+            column = quote(field.column)
+            if increment:
+                assignments.append(f"{column} = {column} + %s")
+                params.append(value)
+            else:
+                assignments.append(f"{column} = %s")
+                params.append(field.get_db_prep_save(value, connection))
+        sql = f"UPDATE {quote(opts.db_table)} SET {', '.join(assignments)} WHERE {quote(opts.pk.column)} = %s"
+        params.append(self.pk)
+        if limit is not None:
+            sql += f" AND {quote(opts.get_field('message_count').column)} < %s"
+            params.append(limit)
+        return f"{sql} RETURNING {quote(opts.get_field('last_seq').column)}", params
+
+    def allocate_seqs(self, count, limit=None, **changes):
+        """
+        Reserve ``count`` consecutive sequence numbers, applying ``changes``
+        in the same UPDATE, and return the first one; None when ``limit``
+        is set and ``message_count`` has reached it.
+        """
+        threads = Thread.objects.filter(pk=self.pk)
+        with transaction.atomic(using=threads.db):
+            # The row lock makes the read and the UPDATE one step for concurrent senders
+            locked = threads.select_for_update()
+            if limit is not None:
+                locked = locked.filter(message_count__lt=limit)
+            last_seq = locked.values_list("last_seq", flat=True).first()
+            if last_seq is None:
+                return None
+            threads.update(last_seq=last_seq + count, **changes)
+        return last_seq + 1
+
+    def unread_count_for(self, user):
+        if user == self.user1:
+            return self.user1_unread_count
+        elif user == self.user2:
+            return self.user2_unread_count
+        return 0
+
+    def inbox_counts(self, messages):
+        """
+        The newest of ``messages`` (all in this thread, saved or about to
+        be) and, per unread count field, ``(received, replied)``: how many
+        of them the participant received after their own latest one, and
+        whether they sent any. Sending counts as reading.
+        """
+        messages = sorted(messages, key=lambda message: (message.timestamp, message.seq or 0))
+        unread = {}
+        for reader_id, field in ((self.user1_id, "user1_unread_count"), (self.user2_id, "user2_unread_count")):
+            received = 0
+            replied = False
+            for message in messages:
+                if message.sender_id == reader_id:
+                    received, replied = 0, True
+                else:
+                    received += 1
+            unread[field] = (received, replied)
+        return messages[-1], unread
+
+    def inbox_changes(self, messages):
+        """
+        ``update()`` kwargs that point the inbox preview at the newest of
+        ``messages`` and adjust unread counts, see ``inbox_counts()``.
+        """
+        last, unread = self.inbox_counts(messages)
+        changes = {"last_message_id": last.uid, "last_activity_at": last.timestamp}
+        for field, (received, replied) in unread.items():
+            changes[field] = received if replied else F(field) + received
+        return changes
+
+    def record_messages(self, messages):
+        """Apply ``inbox_changes``; call in the transaction that inserted the messages."""
+        Thread.objects.filter(pk=self.pk).update(**self.inbox_changes(messages))
+
 
 class Message(models.Model):
+    # Assigned by the application, so a message can be referenced before it is written
+    uid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     thread = models.ForeignKey(Thread, related_name="messages", on_delete=models.CASCADE)
     sender = models.ForeignKey(User, related_name="messages", on_delete=models.CASCADE)
     content = models.TextField()
     timestamp = models.DateTimeField(default=timezone.now)
+    # Position in the thread, allocated from Thread.last_seq in the inserting transaction
+    seq = models.PositiveBigIntegerField(editable=False)
 
     class Meta:
-        ordering = ["timestamp"]
+        ordering = ["timestamp", "id"]
+        indexes = [
+            # Backs keyset pagination of a thread's history (see chat.pagination).
+            models.Index(fields=["thread", "timestamp", "id"], name="chat_msg_thread_ts_id_idx"),
+        ]
+        constraints = [
+            # Also backs replaying a thread from a sequence number on reconnect
+            models.UniqueConstraint(fields=["thread", "seq"], name="chat_msg_thread_seq_uniq"),
+        ]
 
     def __str__(self):
         return f"{self.sender.username}: {self.content[:20]}"
 
+
+class MessageArchiveSegment(models.Model):
+    """
+    A batch of a thread's oldest messages, moved out of ``Message`` by the
+    ``archive_messages`` command and stored compressed (see chat.archive).
+    Segments of a thread never overlap and all sort before its live messages.
+    """
+
+    thread = models.ForeignKey(Thread, related_name="archive_segments", on_delete=models.CASCADE)
+    # (timestamp, id) keys of the first and last message, in history order
+    first_timestamp = models.DateTimeField()
+    first_message_id = models.PositiveBigIntegerField()
+    last_timestamp = models.DateTimeField()
+    last_message_id = models.PositiveBigIntegerField()
+    # Bounds for finding a message by id
+    min_message_id = models.PositiveBigIntegerField()
+    max_message_id = models.PositiveBigIntegerField()
+    message_count = models.PositiveIntegerField()
+    codec = models.CharField(max_length=16)
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["thread", "last_timestamp", "last_message_id"], name="chat_archive_thread_last_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.thread}: {self.message_count} archived message(s)"
+
+
+class ReadReceipt(models.Model):
+    """How far a participant has read a thread; the cursor only moves forward."""
+
+    thread = models.ForeignKey(Thread, related_name="read_receipts", on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name="read_receipts", on_delete=models.CASCADE)
+    last_read_message_id = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("thread", "user")
+
+    def __str__(self):
+        return f"{self.user} read {self.thread} up to #{self.last_read_message_id}"
+
     @staticmethod
-    def count_between_nonfriends(user1, user2):
-        """Count total messages exchanged between two users (any direction)."""
-        from django.db.models import Q
-
-        return Message.objects.filter(
-            Q(sender=user1, thread__user2=user2)
-            | Q(sender=user2, thread__user2=user1)
-            | Q(sender=user1, thread__user1=user2)
-            | Q(sender=user2, thread__user1=user1)
-        ).count()
+    def advance(thread, user, message_id) -> bool:
+        """
+        Move ``user``'s cursor in ``thread`` forward to ``message_id`` and
+        recompute their unread count. Returns False when the message is not
+        in the thread or the cursor is already past it.
+        """
+        with transaction.atomic():
+            if not thread.messages.filter(id=message_id).exists():
+                return False
+            receipt, created = ReadReceipt.objects.get_or_create(
+                thread=thread, user=user, defaults={"last_read_message_id": message_id}
+            )
+            if not created:
+                moved = ReadReceipt.objects.filter(
+                    pk=receipt.pk, last_read_message_id__lt=message_id
+                ).update(last_read_message_id=message_id, updated_at=timezone.now())
+                if not moved:
+                    return False
+
+            # Own messages count as read, so only count what arrived after the later of the two
+            last_sent = thread.messages.filter(sender=user).aggregate(last=Max("id"))["last"] or 0
+            unread = thread.messages.filter(id__gt=max(message_id, last_sent)).exclude(sender=user).count()
+            field = "user1_unread_count" if user.pk == thread.user1_id else "user2_unread_count"
+            Thread.objects.filter(pk=thread.pk).update(**{field: unread})
+        return True
@@ -0,0 +1,107 @@
+"""
+Outbound frame queue of a chat socket.
+
+Consumers hand every frame to their ``Outbox`` and a writer task sends
+them in order, so a client that stops reading backs up its own queue
+instead of the consumer's channel-layer inbox, where the layer would drop
+events silently once ``capacity`` is reached.
+
+Once ``HIGH_WATER`` frames are queued the outbox sheds load in steps:
+
+1. ephemeral frames (typing, presence) are dropped, queued ones included
+2. frames with a coalescing key (read receipts) replace the queued frame
+   with the same key instead of adding one
+3. past ``LIMIT`` frames the consumer gives up and closes the socket with
+   ``SLOW_CONSUMER_CLOSE_CODE``; the client reconnects with ``last_seq``
+
+Per-process counters are available from ``stats()``.
+"""
+import asyncio
+from collections import Counter, deque
+
+from django.conf import settings
+
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+DEFAULTS = {
+    "HIGH_WATER": 200,
+    "LIMIT": 1000,
+}
+
+counters = Counter()
+
+
+def outbox_settings():
+    return {**DEFAULTS, **getattr(settings, "CHAT_OUTBOX", {})}
+
+
+def stats():
+    return dict(counters)
+
+
+class Outbox:
+    def __init__(self, high_water, limit):
+        self.high_water = high_water
+        self.limit = limit
+        # Entries are [key, payload, ephemeral]; keyed ones are also indexed for coalescing
+        self.entries = deque()
+        self.keyed = {}
+        self.ephemeral_count = 0
+        self.ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def put(self, payload, ephemeral=False, key=None):
+        """Queue ``payload`` (``send()`` kwargs); False when the queue is past its limit."""
+        if len(self.entries) >= self.high_water:
+            if ephemeral:
+                counters["dropped_ephemeral"] += 1
+                return True
+            if self.ephemeral_count:
+                self.shed_ephemeral()
+            if key is not None and key in self.keyed:
+                self.keyed[key][1] = payload
+                counters["coalesced"] += 1
+                return True
+            if len(self.entries) >= self.limit:
+                counters["overflowed"] += 1
+                return False
+
+        entry = [key, payload, ephemeral]
+        self.entries.append(entry)
+        if key is not None:
+            self.keyed[key] = entry
+        self.ephemeral_count += ephemeral
+        counters["queued"] += 1
+        self.ready.set()
+        return True
+
+    def shed_ephemeral(self):
+        kept = deque()
+        for entry in self.entries:
+            if entry[2]:
+                counters["dropped_ephemeral"] += 1
+                if entry[0] is not None and self.keyed.get(entry[0]) is entry:
+                    del self.keyed[entry[0]]
+            else:
+                kept.append(entry)
+        self.entries = kept
+        self.ephemeral_count = 0
+
+    async def get(self):
+        while not self.entries:
+            self.ready.clear()
+            await self.ready.wait()
+        entry = self.entries.popleft()
+        key, payload, ephemeral = entry
+        if key is not None and self.keyed.get(key) is entry:
+            del self.keyed[key]
+        self.ephemeral_count -= ephemeral
+        counters["sent"] += 1
+        return payload
+
+    def clear(self):
+        self.entries.clear()
+        self.keyed.clear()
+        self.ephemeral_count = 0
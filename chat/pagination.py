@@ -0,0 +1,278 @@
+import base64
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from chat.archive import archived_messages, find_archived_message
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a composite, strictly increasing key.
+
+    Pages are selected with a range condition on ``keyset`` instead of an
+    OFFSET, so every page is an index range scan no matter how deep it is.
+
+    Query parameters:
+      * ``before=<cursor>`` - rows with a key lower than the cursor
+      * ``after=<cursor>``  - rows with a key greater than the cursor
+      * ``since_id=<pk>``   - rows after the row with that primary key
+      * ``limit=<n>``       - page size, capped at ``max_page_size``
+
+    Without any of them the page holds the rows with the greatest keys.
+    """
+
+    keyset = ("id",)
+    page_size = 50
+    max_page_size = 200
+    newest_first = False
+
+    before_query_param = "before"
+    after_query_param = "after"
+    since_id_query_param = "since_id"
+    limit_query_param = "limit"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.direction = "latest"
+        key = None
+
+        before = request.query_params.get(self.before_query_param)
+        after = request.query_params.get(self.after_query_param)
+        since_id = request.query_params.get(self.since_id_query_param)
+
+        if before:
+            self.direction = "before"
+            key = self.decode_cursor(queryset, before)
+        elif after:
+            self.direction = "after"
+            key = self.decode_cursor(queryset, after)
+        elif since_id:
+            self.direction = "after"
+            key = self.get_key_for_pk(queryset, since_id)
+
+        rows = self.fetch_rows(queryset, key, self.limit + 1)
+        self.has_more = len(rows) > self.limit
+        rows = rows[: self.limit]
+
+        # Rows are fetched in scan order; flip them to the display order.
+        ascending = rows if self.direction == "after" else rows[::-1]
+        self.first_key = self.get_key(ascending[0]) if ascending else None
+        self.last_key = self.get_key(ascending[-1]) if ascending else None
+        return ascending[::-1] if self.newest_first else ascending
+
+    def fetch_rows(self, queryset, key, limit):
+        """Up to ``limit`` rows beyond ``key`` in scan order (descending unless paging "after")."""
+        if self.direction == "after":
+            queryset = queryset.filter(self.build_range(key, "gt")).order_by(*self.keyset)
+        else:
+            if key is not None:
+                queryset = queryset.filter(self.build_range(key, "lt"))
+            queryset = queryset.order_by(*(f"-{field}" for field in self.keyset))
+        return list(queryset[:limit])
+
+    def is_latest_page(self, request):
+        """Whether the request asks for the default page, the rows with the greatest keys."""
+        params = (self.before_query_param, self.after_query_param, self.since_id_query_param)
+        return not any(request.query_params.get(param) for param in params)
+
+    def paginate_rows(self, rows, request, has_more):
+        """
+        Set up the default page from ``rows`` that were already serialized
+        elsewhere (e.g. a cache), in ascending key order. ``has_more`` tells
+        whether rows with lower keys exist.
+        """
+        self.request = request
+        self.direction = "latest"
+        self.has_more = has_more
+        self.first_key = self.get_row_key(rows[0]) if rows else None
+        self.last_key = self.get_row_key(rows[-1]) if rows else None
+        return rows[::-1] if self.newest_first else rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if limit <= 0:
+            return self.page_size
+        return min(limit, self.max_page_size)
+
+    def get_next_link(self):
+        """Link to the rows that come after this page in key order."""
+        if self.last_key is None:
+            return None
+        if self.direction == "latest" or (self.direction == "after" and not self.has_more):
+            return None
+        return self.build_link(self.after_query_param, self.last_key)
+
+    def get_previous_link(self):
+        """Link to the rows that come before this page in key order."""
+        if self.first_key is None:
+            return None
+        if self.direction != "after" and not self.has_more:
+            return None
+        return self.build_link(self.before_query_param, self.first_key)
+
+    def build_link(self, param, key):
+        url = self.request.build_absolute_uri()
+        for name in (self.before_query_param, self.after_query_param, self.since_id_query_param):
+            url = remove_query_param(url, name)
+        return replace_query_param(url, param, self.encode_cursor(key))
+
+    def build_range(self, key, lookup):
+        """
+        Expand ``keyset > key`` (or ``<``) into an OR of prefix equalities,
+        e.g. ``(a > x) OR (a = x AND b > y)`` for a two-column key.
+        """
+        condition = Q()
+        for position, field in enumerate(self.keyset):
+            prefix = {name: key[i] for i, name in enumerate(self.keyset[:position])}
+            condition |= Q(**prefix, **{f"{field}__{lookup}": key[position]})
+        return condition
+
+    def get_key(self, obj):
+        return tuple(getattr(obj, field) for field in self.keyset)
+
+    def get_row_key(self, row):
+        return tuple(row[field] for field in self.keyset)
+
+    def get_key_for_pk(self, queryset, pk):
+        try:
+            key = queryset.filter(pk=pk).values_list(*self.keyset).first()
+        except (ValueError, ValidationError):
+            key = None
+        if key is None:
+            raise NotFound(self.invalid_cursor_message)
+        return key
+
+    def encode_cursor(self, key):
+        raw = "|".join(value.isoformat() if hasattr(value, "isoformat") else str(value) for value in key)
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    def split_cursor(self, cursor):
+        padded = cursor + "=" * (-len(cursor) % 4)
+        parts = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        if len(parts) != len(self.keyset):
+            raise ValueError
+        return parts
+
+    def decode_cursor(self, queryset, cursor):
+        try:
+            parts = self.split_cursor(cursor)
+            opts = queryset.model._meta
+            return tuple(
+                opts.get_field(field).to_python(part) for field, part in zip(self.keyset, parts)
+            )
+        except (TypeError, ValueError, UnicodeDecodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class MessageCursorPagination(KeysetPagination):
+    """
+    Message history, keyed on ``(timestamp, id)`` and shown oldest first.
+    Archived messages (see ``chat.archive``) sort before the table's, so
+    pages that run past the oldest message in the table continue into the
+    archive of the view's ``thread``.
+    """
+
+    keyset = ("timestamp", "id")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.thread = getattr(view, "thread", None)
+        return super().paginate_queryset(queryset, request, view)
+
+    def fetch_rows(self, queryset, key, limit):
+        if self.thread is None:
+            return super().fetch_rows(queryset, key, limit)
+
+        if self.direction == "after":
+            rows = archived_messages(self.thread, key, self.direction, limit)
+            if len(rows) < limit:
+                newest = self.get_key(rows[-1]) if rows else key
+                rows += super().fetch_rows(queryset, newest, limit - len(rows))
+            return rows
+
+        rows = super().fetch_rows(queryset, key, limit)
+        # Sequence numbers start at 1: nothing is older than a row holding it
+        if len(rows) < limit and not (rows and rows[-1].seq == 1):
+            oldest = self.get_key(rows[-1]) if rows else key
+            rows += archived_messages(self.thread, oldest, self.direction, limit - len(rows))
+        return rows
+
+    def get_key_for_pk(self, queryset, pk):
+        try:
+            return super().get_key_for_pk(queryset, pk)
+        except NotFound:
+            message = find_archived_message(self.thread, int(pk)) if self.thread and str(pk).isdigit() else None
+            if message is None:
+                raise
+            return self.get_key(message)
+
+
+class InboxCursorPagination(KeysetPagination):
+    """Threads keyed on ``(last_activity_at, id)``, most recently active first."""
+
+    keyset = ("last_activity_at", "id")
+    page_size = 30
+    newest_first = True
+
+
+class SearchCursorPagination(KeysetPagination):
+    """
+    Search results keyed on ``(rank, id)``, best match first. Ranks only
+    exist for one query, so pages are walked forward with ``?after=<cursor>``.
+    """
+
+    keyset = ("rank", "id")
+    page_size = 20
+    max_page_size = 100
+
+    def paginate_search(self, search, request):
+        """``search(after, limit)`` returns up to ``limit`` results in key order after the key ``after``."""
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.direction = "after"
+        cursor = request.query_params.get(self.after_query_param)
+        key = self.decode_cursor(None, cursor) if cursor else None
+
+        rows = search(key, self.limit + 1)
+        self.has_more = len(rows) > self.limit
+        rows = rows[: self.limit]
+        self.first_key = self.get_key(rows[0]) if rows else None
+        self.last_key = self.get_key(rows[-1]) if rows else None
+        return rows
+
+    def get_previous_link(self):
+        return None
+
+    def decode_cursor(self, queryset, cursor):
+        try:
+            rank, pk = self.split_cursor(cursor)
+            return float(rank), int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
@@ -0,0 +1,195 @@
+"""
+Write-behind persistence for messages sent over WebSockets.
+
+When ``CHAT_WRITE_BEHIND["ENABLED"]`` is on, ``ChatConsumer`` builds the
+``Message`` in memory (its ``uid`` and ``timestamp`` are assigned on
+construction), broadcasts it straight away and hands it to the
+``MessageWriter`` of the running event loop. The writer flushes pending
+messages with ``bulk_create`` once ``BATCH_SIZE`` messages are queued or
+``FLUSH_INTERVAL`` seconds have passed, whichever comes first.
+
+``ACK`` selects when the sender is acknowledged:
+
+* ``"flush"``     - after the batch holding the message is committed
+* ``"broadcast"`` - as soon as the message has been broadcast; a failed
+  flush then loses the batch, which is only logged
+
+Sequence numbers are allocated when the batch is written, in the UPDATE
+that bumps the thread's counters, so the broadcast frame of a write-behind
+message has no ``id`` or ``seq``. Once a batch is committed every thread
+in it gets a ``chat.persisted`` event with the ids and seqs of its
+messages, whatever the ack mode, so recipients can number them, mark them
+read or page from them. Until then ``queued_messages()`` hands them to a
+resuming socket's replay, which the database cannot.
+
+Pending messages are drained on ASGI lifespan shutdown, see ``core.asgi``.
+"""
+import asyncio
+import logging
+import weakref
+from collections import defaultdict
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from chat import recent
+from chat.events import persisted_event, thread_group_name
+from chat.executor import database_task
+from chat.models import Message
+
+logger = logging.getLogger(__name__)
+
+ACK_AFTER_FLUSH = "flush"
+ACK_AFTER_BROADCAST = "broadcast"
+
+DEFAULTS = {
+    "ENABLED": False,
+    "BATCH_SIZE": 100,
+    "FLUSH_INTERVAL": 0.05,
+    "ACK": ACK_AFTER_FLUSH,
+}
+
+
+def write_behind_settings():
+    return {**DEFAULTS, **getattr(settings, "CHAT_WRITE_BEHIND", {})}
+
+
+def write_batch(messages):
+    """
+    Insert a batch of messages, numbering them per thread in submission order;
+    one UPDATE per thread allocates the seqs and updates its counters and
+    inbox preview.
+    """
+    per_thread = defaultdict(list)
+    for message in messages:
+        per_thread[message.thread_id].append(message)
+
+    with transaction.atomic():
+        for thread_messages in per_thread.values():
+            thread_messages[0].thread.add_messages(thread_messages)
+        Message.objects.bulk_create(messages)
+        for thread_messages in per_thread.values():
+            recent.write_through(thread_messages)
+
+
+class MessageWriter:
+    """Buffers messages and writes them in size- or time-bounded batches."""
+
+    def __init__(self, batch_size, flush_interval):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        # The batch being written, out of _pending but not committed yet
+        self._writing = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._draining = False
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def submit(self, message, track=False):
+        """
+        Queue ``message`` for the next flush. With ``track`` a future is
+        returned that resolves (or fails) once the message is committed.
+        """
+        if self._draining:
+            raise RuntimeError("The message writer is draining and accepts no new messages.")
+
+        future = asyncio.get_running_loop().create_future() if track else None
+        self._pending.append((message, future))
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return future
+
+    async def _run(self):
+        while self._pending:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[: self.batch_size]
+                del self._pending[: self.batch_size]
+                self._writing = batch
+                try:
+                    await self._write(batch)
+                finally:
+                    self._writing = []
+
+    def queued(self, thread_id):
+        """The thread's messages submitted and not committed yet, in submission order."""
+        return [message for message, _ in self._writing + self._pending if message.thread_id == thread_id]
+
+    async def _write(self, batch):
+        try:
+            await database_task(write_batch, shed=False)([message for message, _ in batch])
+        except Exception as exc:
+            logger.exception("Failed to persist a batch of %d message(s)", len(batch))
+            for _, future in batch:
+                if future is not None and not future.done():
+                    future.set_exception(exc)
+        else:
+            for message, future in batch:
+                if future is not None and not future.done():
+                    future.set_result(message)
+            await self._announce([message for message, _ in batch])
+
+    async def _announce(self, messages):
+        """Send each thread's participants the ids of its messages in the batch."""
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        per_thread = defaultdict(list)
+        for message in messages:
+            per_thread[message.thread_id].append(message)
+        for thread_id, thread_messages in per_thread.items():
+            try:
+                await channel_layer.group_send(thread_group_name(thread_id), persisted_event(thread_id, thread_messages))
+            except Exception:
+                logger.exception(
+                    "Failed to announce %d persisted message(s) of thread %s", len(thread_messages), thread_id
+                )
+
+    async def drain(self):
+        """Stop accepting messages and flush everything still queued."""
+        self._draining = True
+        self._wakeup.set()
+        await self.flush()
+        if self._task is not None:
+            await self._task
+
+
+_writers = weakref.WeakKeyDictionary()
+
+
+def get_message_writer():
+    """The writer bound to the running event loop, created on first use."""
+    loop = asyncio.get_running_loop()
+    writer = _writers.get(loop)
+    if writer is None:
+        config = write_behind_settings()
+        writer = _writers[loop] = MessageWriter(config["BATCH_SIZE"], config["FLUSH_INTERVAL"])
+    return writer
+
+
+def queued_messages(thread_id):
+    """``MessageWriter.queued()`` of the running loop's writer, without creating one."""
+    writer = _writers.get(asyncio.get_running_loop())
+    return writer.queued(thread_id) if writer is not None else []
+
+
+async def drain_message_writer():
+    writer = _writers.pop(asyncio.get_running_loop(), None)
+    if writer is not None:
+        await writer.drain()
@@ -0,0 +1,125 @@
+"""
+Online presence, kept out of the database.
+
+Every open socket of a user holds a lease that expires ``CHAT_PRESENCE_TTL``
+seconds after it was last refreshed (on connect and on each heartbeat). A
+user is online while any lease is live. Leases live next to the channel
+layer: in Redis (one sorted set per user, sharded over
+``CHANNEL_REDIS_HOSTS`` like the layer itself) when it is configured, and in
+process memory alongside the in-memory layer otherwise.
+"""
+import asyncio
+import binascii
+import time
+import weakref
+
+from django.conf import settings
+
+KEY_PREFIX = "chat:presence:"
+
+
+def presence_ttl():
+    return getattr(settings, "CHAT_PRESENCE_TTL", 60)
+
+
+class LocalPresenceStore:
+    """Process-local leases; only correct with a single worker."""
+
+    def __init__(self):
+        self.leases = {}
+
+    def _live(self, user_id, now):
+        leases = self.leases.get(user_id, {})
+        for channel_name in [name for name, expires in leases.items() if expires <= now]:
+            del leases[channel_name]
+        return leases
+
+    async def add(self, user_id, channel_name, ttl):
+        """Take or refresh a lease; True when this made the user come online."""
+        now = time.monotonic()
+        leases = self.leases.setdefault(user_id, self._live(user_id, now))
+        was_online = bool(leases)
+        leases[channel_name] = now + ttl
+        return not was_online
+
+    async def remove(self, user_id, channel_name):
+        """Drop a lease; True when this made the user go offline."""
+        leases = self._live(user_id, time.monotonic())
+        if leases.pop(channel_name, None) is None:
+            return False
+        if not leases:
+            self.leases.pop(user_id, None)
+            return True
+        return False
+
+    async def online(self, user_ids):
+        now = time.monotonic()
+        return {user_id for user_id in user_ids if self._live(user_id, now)}
+
+
+class RedisPresenceStore:
+    """Leases as ``{channel_name: expiry}`` sorted sets, one key per user."""
+
+    def __init__(self, hosts):
+        self.hosts = hosts
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _shard(self, user_id):
+        key = f"{KEY_PREFIX}{user_id}"
+        return binascii.crc32(key.encode()) % len(self.hosts), key
+
+    def _client(self, index):
+        # redis.asyncio connections are bound to the loop that opened them
+        from redis.asyncio import Redis
+
+        clients = self._clients.setdefault(asyncio.get_running_loop(), {})
+        if index not in clients:
+            clients[index] = Redis.from_url(self.hosts[index])
+        return clients[index]
+
+    async def add(self, user_id, channel_name, ttl):
+        index, key = self._shard(user_id)
+        now = time.time()
+        async with self._client(index).pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore(key, "-inf", now)
+            pipe.zcard(key)
+            pipe.zadd(key, {channel_name: now + ttl})
+            pipe.expire(key, int(ttl) + 1)
+            _, live_before, _, _ = await pipe.execute()
+        return live_before == 0
+
+    async def remove(self, user_id, channel_name):
+        index, key = self._shard(user_id)
+        async with self._client(index).pipeline(transaction=True) as pipe:
+            pipe.zrem(key, channel_name)
+            pipe.zremrangebyscore(key, "-inf", time.time())
+            pipe.zcard(key)
+            removed, _, remaining = await pipe.execute()
+        return bool(removed) and remaining == 0
+
+    async def online(self, user_ids):
+        by_shard = {}
+        for user_id in user_ids:
+            index, key = self._shard(user_id)
+            by_shard.setdefault(index, []).append((user_id, key))
+
+        now = time.time()
+        online = set()
+        for index, entries in by_shard.items():
+            async with self._client(index).pipeline(transaction=False) as pipe:
+                for _, key in entries:
+                    pipe.zcount(key, f"({now}", "+inf")
+                counts = await pipe.execute()
+            online.update(user_id for (user_id, _), count in zip(entries, counts) if count)
+        return online
+
+
+_store = None
+
+
+def get_presence_store():
+    global _store
+    if _store is None:
+        hosts = getattr(settings, "CHANNEL_REDIS_HOSTS", [])
+        _store = RedisPresenceStore(hosts) if hosts else LocalPresenceStore()
+    return _store
@@ -0,0 +1,100 @@
+"""
+Wire encodings for the chat sockets, chosen with the WebSocket subprotocol.
+
+* ``chat.json``    - text frames holding JSON objects (the default, also
+  used when the client offers no subprotocol)
+* ``chat.msgpack`` - binary frames holding msgpack maps whose keys are
+  shortened through ``COMPACT_KEYS``, in both directions
+
+Chat messages are encoded once per broadcast in every encoding by
+``encode_broadcast`` and carried pre-encoded in the channel-layer event, so
+a consumer only picks the payload for its connection.
+"""
+import json
+
+import msgpack
+
+COMPACT_KEYS = {
+    "type": "t",
+    "thread_id": "th",
+    "thread_ids": "ths",
+    "id": "i",
+    "uid": "u",
+    "seq": "q",
+    "last_seq": "lq",
+    "message": "m",
+    "messages": "ms",
+    "message_id": "mi",
+    "sender": "s",
+    "timestamp": "ts",
+    "user_id": "ui",
+    "user_ids": "uis",
+    "user": "un",
+    "state": "st",
+    "denied": "d",
+    "online": "o",
+    "thread": "tr",
+    "request": "rq",
+    "event": "e",
+    "retry_after": "ra",
+}
+EXPANDED_KEYS = {short: key for key, short in COMPACT_KEYS.items()}
+
+
+def require_object(data):
+    """
+    ``data`` if it is a JSON object or msgpack map. Like the decoders' own
+    errors (bad JSON or msgpack, invalid UTF-8), this raises ``ValueError``,
+    so callers have a single exception to catch for a malformed frame.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("A frame must hold an object.")
+    return data
+
+
+class JSONCodec:
+    name = "json"
+    subprotocol = "chat.json"
+
+    def encode(self, frame):
+        """Keyword arguments for ``send()``."""
+        return {"text_data": json.dumps(frame)}
+
+    def decode(self, text_data=None, bytes_data=None):
+        return require_object(json.loads(text_data if text_data is not None else bytes_data))
+
+
+class MsgpackCodec:
+    name = "msgpack"
+    subprotocol = "chat.msgpack"
+
+    def encode(self, frame):
+        compact = {COMPACT_KEYS.get(key, key): value for key, value in frame.items()}
+        return {"bytes_data": msgpack.packb(compact)}
+
+    def decode(self, text_data=None, bytes_data=None):
+        if bytes_data is None:
+            # Text frames are still accepted as JSON with the long keys
+            return require_object(json.loads(text_data))
+        data = require_object(msgpack.unpackb(bytes_data))
+        return {EXPANDED_KEYS.get(key, key): value for key, value in data.items()}
+
+
+CODECS = {codec.subprotocol: codec for codec in (JSONCodec(), MsgpackCodec())}
+DEFAULT_CODEC = CODECS[JSONCodec.subprotocol]
+
+
+def negotiate(subprotocols):
+    """
+    The codec for the first offered subprotocol we support, and the
+    subprotocol to accept (``None`` when the client offered none we know).
+    """
+    for subprotocol in subprotocols:
+        if subprotocol in CODECS:
+            return CODECS[subprotocol], subprotocol
+    return DEFAULT_CODEC, None
+
+
+def encode_broadcast(frame):
+    """``frame`` encoded once for every codec, keyed by codec name."""
+    return {codec.name: codec.encode(frame) for codec in CODECS.values()}
@@ -0,0 +1,76 @@
+"""
+Token-bucket rate limits for chat events.
+
+``CHAT_RATE_LIMITS`` maps an event type (``"message"``, ``"read"``,
+``"subscribe"``) to a ``(rate, burst)`` pair per scope: a bucket holds up
+to ``burst`` tokens and refills ``rate`` tokens per second; each event
+takes one.
+
+* ``"connection"`` - one socket; kept in the consumer's memory
+* ``"user"``       - all of a user's sockets and REST calls; kept in
+  Django's default cache, so set ``CACHE_REDIS_URL`` to share it between
+  workers. Like DRF's own throttles the cache update is not atomic, so
+  concurrent requests may let a token or two more through.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+KEY = "chat:ratelimit:{}:{}"
+
+
+def rate_limit(event, scope):
+    """``(rate, burst)`` for ``event`` in ``scope``, or None when it is unlimited."""
+    if not getattr(settings, "CHAT_RATE_LIMITS_ENABLED", True):
+        return None
+    return getattr(settings, "CHAT_RATE_LIMITS", {}).get(event, {}).get(scope)
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, tokens=None, updated=None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst if tokens is None else tokens
+        self.updated = updated
+
+    def take(self, now):
+        """Take a token; returns 0 when one was available, else the seconds until one is."""
+        if self.updated is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class ConnectionRateLimiter:
+    """The ``"connection"`` buckets of one socket."""
+
+    def __init__(self):
+        self.buckets = {}
+
+    def take(self, event):
+        limit = rate_limit(event, "connection")
+        if limit is None:
+            return 0.0
+        bucket = self.buckets.get(event)
+        if bucket is None:
+            bucket = self.buckets[event] = TokenBucket(*limit)
+        return bucket.take(time.monotonic())
+
+
+def take_user_token(user_id, event):
+    """Take a token from the user's shared ``event`` bucket; returns 0 or the seconds to wait."""
+    limit = rate_limit(event, "user")
+    if limit is None:
+        return 0.0
+    rate, burst = limit
+    key = KEY.format(event, user_id)
+    bucket = TokenBucket(rate, burst, *(cache.get(key) or ()))
+    wait = bucket.take(time.time())
+    # An untouched bucket is full again after burst / rate seconds
+    cache.set(key, (bucket.tokens, bucket.updated), math.ceil(burst / rate) + 1)
+    return wait
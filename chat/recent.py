@@ -0,0 +1,148 @@
+"""
+Per-thread cache of the latest serialized messages.
+
+The default page of ``MessageListView`` is served from here. Each thread
+has one entry in the ``CHAT_RECENT_MESSAGES["CACHE"]`` cache alias holding
+up to ``PER_THREAD`` messages (as ``MessageSerializer`` data) in the
+``(timestamp, id)`` order ``MessageCursorPagination`` pages by, the highest
+``seq`` among them, and whether they reach back to the thread's oldest
+message. An entry is only used while that ``seq`` equals
+``Thread.last_seq``, so a racing or missed write costs a refill from the
+database, never a stale page. Entries are also kept under
+``MAX_ENTRY_BYTES`` of JSON by dropping their oldest messages; a page
+longer than what is left is read from the database.
+
+Both send paths write through after their transaction commits, appending
+to the entry when it ends right before the new messages, in ``seq`` as well
+as in key order. Timestamps are taken before seqs are allocated, so
+concurrent sends can number messages out of key order; such an entry is
+dropped rather than appended to out of place. Eviction is left to the
+cache backend: the ``chat_recent`` locmem alias drops the least recently
+used threads beyond ``MAX_ENTRIES``, which with the entry size cap bounds
+it to about ``MAX_ENTRIES * MAX_ENTRY_BYTES``; on Redis configure
+``maxmemory`` with ``allkeys-lru``.
+"""
+import json
+from collections import Counter
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+DEFAULTS = {
+    "ENABLED": True,
+    "CACHE": "default",
+    "PER_THREAD": 50,
+    "MAX_ENTRY_BYTES": 64 * 1024,
+    "TIMEOUT": 3600,
+}
+KEY = "chat:recent:{}"
+
+# Per-process hit/miss counters, see stats()
+counters = Counter()
+
+
+def recent_settings():
+    return {**DEFAULTS, **getattr(settings, "CHAT_RECENT_MESSAGES", {})}
+
+
+def serialize(messages):
+    from chat.serializers import MessageSerializer
+
+    return [dict(data) for data in MessageSerializer(messages, many=True).data]
+
+
+def newest_within(rows, max_bytes):
+    """The newest of ``rows`` whose JSON fits in ``max_bytes``, and whether older ones were dropped."""
+    size = 0
+    for index in range(len(rows) - 1, -1, -1):
+        size += len(json.dumps(rows[index], cls=DjangoJSONEncoder))
+        if size > max_bytes:
+            return rows[index + 1:], True
+    return rows, False
+
+
+def row_key(row):
+    """The ``(timestamp, id)`` pagination key of a serialized message."""
+    return parse_datetime(row["timestamp"]), row["id"]
+
+
+def make_entry(rows, complete, config):
+    """An entry for ``rows`` in key order; ``complete`` when they start at the thread's oldest message."""
+    latest = rows[-config["PER_THREAD"]:]
+    kept, dropped = newest_within(latest, config["MAX_ENTRY_BYTES"])
+    return {
+        "last_seq": max((row["seq"] for row in rows), default=0),
+        "messages": kept,
+        "complete": complete and len(latest) == len(rows) and not dropped,
+    }
+
+
+def stats():
+    lookups = counters["hits"] + counters["misses"]
+    return {**counters, "hit_ratio": counters["hits"] / lookups if lookups else None}
+
+
+def get(thread, limit):
+    """
+    The latest ``limit`` messages of ``thread`` in ascending key order,
+    serialized, and whether older ones exist; None when they are not cached
+    and up to date.
+    """
+    config = recent_settings()
+    if not config["ENABLED"] or limit > config["PER_THREAD"]:
+        return None
+    entry = caches[config["CACHE"]].get(KEY.format(thread.pk))
+    if (
+        entry is None
+        or entry["last_seq"] != thread.last_seq
+        # Older messages were dropped or never cached
+        or (not entry["complete"] and len(entry["messages"]) < limit)
+    ):
+        counters["misses"] += 1
+        return None
+    counters["hits"] += 1
+    messages = entry["messages"]
+    return messages[-limit:], len(messages) > limit or not entry["complete"]
+
+
+def fill(thread, messages, complete):
+    """
+    Cache ``messages``, the thread's latest ``PER_THREAD`` in ascending key
+    order, ``complete`` when no older ones exist; returns them serialized.
+    """
+    config = recent_settings()
+    rows = serialize(messages)
+    if config["ENABLED"]:
+        caches[config["CACHE"]].set(KEY.format(thread.pk), make_entry(rows, complete, config), config["TIMEOUT"])
+    return rows
+
+
+def append(thread_id, rows):
+    """
+    Extend the entry with serialized ``rows`` (ascending key order) if it
+    ends right before them; drop it if they belong between its messages.
+    """
+    config = recent_settings()
+    cache = caches[config["CACHE"]]
+    key = KEY.format(thread_id)
+    entry = cache.get(key)
+    if entry is None or entry["last_seq"] != min(row["seq"] for row in rows) - 1:
+        return
+    if entry["messages"] and row_key(rows[0]) <= row_key(entry["messages"][-1]):
+        cache.delete(key)
+        return
+    entry = make_entry(entry["messages"] + rows, entry["complete"], config)
+    cache.set(key, entry, config["TIMEOUT"])
+    counters["writes"] += 1
+
+
+def write_through(messages):
+    """Append saved ``messages`` of one thread to its entry once the current transaction commits."""
+    if not messages or not recent_settings()["ENABLED"]:
+        return
+    rows = serialize(sorted(messages, key=lambda message: (message.timestamp, message.pk)))
+    thread_id = messages[0].thread_id
+    transaction.on_commit(lambda: append(thread_id, rows))
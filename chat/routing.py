@@ -2,5 +2,6 @@ from django.urls import re_path
 from chat import consumers
 
 websocket_urlpatterns = [
+    re_path(r"ws/chat/$", consumers.UserChatConsumer.as_asgi()),
     re_path(r"ws/chat/(?P<thread_id>\d+)/$", consumers.ChatConsumer.as_asgi()),
 ]
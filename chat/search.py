@@ -0,0 +1,173 @@
+"""
+Full-text search over message content.
+
+The index lives next to ``chat_message`` and is maintained by the database
+on every insert, update and delete, ``bulk_create`` included:
+
+* SQLite: an external-content FTS5 table, ``chat_message_fts``, kept in
+  step by triggers on ``chat_message``
+* PostgreSQL: a generated ``tsvector`` column, ``search_vector``, with a
+  GIN index
+
+Neither is part of the ``Message`` model, so the ORM never reads or writes
+them; migration 0008 installs them and ``rebuild_search_index`` rebuilds
+them. Results are ordered by ``rank`` (lower is better) and ``id``, which
+``SearchCursorPagination`` uses as its keyset.
+
+Both backends mark matches in the snippet with private-use characters;
+``render_snippet`` HTML-escapes the text and only then turns the markers
+into ``<mark>`` tags, so message content never reaches the client as markup.
+"""
+import html
+import re
+
+from django.db import connection
+
+from chat.models import Message
+
+# Match markers in raw snippets: private-use characters, left alone by html.escape
+SNIPPET_START = "\ue000"
+SNIPPET_END = "\ue001"
+SNIPPET_WORDS = 12
+
+
+class SearchUnavailable(Exception):
+    """Raised by ``search_messages`` on a database without a search backend."""
+
+
+class SQLiteSearch:
+    install_sql = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS chat_message_fts USING fts5("
+        "content, content='chat_message', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS chat_message_fts_ai AFTER INSERT ON chat_message BEGIN "
+        "INSERT INTO chat_message_fts(rowid, content) VALUES (new.id, new.content); END",
+        "CREATE TRIGGER IF NOT EXISTS chat_message_fts_ad AFTER DELETE ON chat_message BEGIN "
+        "INSERT INTO chat_message_fts(chat_message_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+        "CREATE TRIGGER IF NOT EXISTS chat_message_fts_au AFTER UPDATE OF content ON chat_message BEGIN "
+        "INSERT INTO chat_message_fts(chat_message_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+        "INSERT INTO chat_message_fts(rowid, content) VALUES (new.id, new.content); END",
+    ]
+    uninstall_sql = [
+        "DROP TRIGGER IF EXISTS chat_message_fts_au",
+        "DROP TRIGGER IF EXISTS chat_message_fts_ad",
+        "DROP TRIGGER IF EXISTS chat_message_fts_ai",
+        "DROP TABLE IF EXISTS chat_message_fts",
+    ]
+    # Also restores the triggers, which SQLite drops whenever Django rebuilds chat_message
+    rebuild_sql = install_sql + ["INSERT INTO chat_message_fts(chat_message_fts) VALUES ('rebuild')"]
+
+    def match_expression(self, query):
+        # Quote every word so user input is never parsed as FTS5 syntax
+        words = re.findall(r"\w+", query)
+        return " ".join('"{}"'.format(word) for word in words)
+
+    def search(self, user_id, query, thread_id, after, limit):
+        match = self.match_expression(query)
+        if not match:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(*self.search_sql(user_id, match, thread_id, after, limit))
+            return cursor.fetchall()
+
+    def search_sql(self, user_id, match, thread_id, after, limit):
+        sql = [
+            "SELECT m.id, bm25(chat_message_fts) AS score,",
+            "snippet(chat_message_fts, 0, %s, %s, '…', %s)",
+            "FROM chat_message_fts",
+            "JOIN chat_message m ON m.id = chat_message_fts.rowid",
+            "JOIN chat_thread t ON t.id = m.thread_id",
+            "WHERE chat_message_fts MATCH %s AND (t.user1_id = %s OR t.user2_id = %s)",
+        ]
+        params = [SNIPPET_START, SNIPPET_END, SNIPPET_WORDS, match, user_id, user_id]
+        if thread_id is not None:
+            sql.append("AND m.thread_id = %s")
+            params.append(thread_id)
+        if after is not None:
+            sql.append("AND (bm25(chat_message_fts) > %s OR (bm25(chat_message_fts) = %s AND m.id > %s))")
+            params += [after[0], after[0], after[1]]
+        sql.append("ORDER BY score, m.id LIMIT %s")
+        params.append(limit)
+        return " ".join(sql), params
+
+
+class PostgresSearch:
+    install_sql = [
+        "ALTER TABLE chat_message ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED",
+        "CREATE INDEX IF NOT EXISTS chat_message_search_idx ON chat_message USING GIN (search_vector)",
+    ]
+    uninstall_sql = [
+        "DROP INDEX IF EXISTS chat_message_search_idx",
+        "ALTER TABLE chat_message DROP COLUMN IF EXISTS search_vector",
+    ]
+    rebuild_sql = install_sql + ["REINDEX INDEX chat_message_search_idx"]
+
+    def search(self, user_id, query, thread_id, after, limit):
+        with connection.cursor() as cursor:
+            cursor.execute(*self.search_sql(user_id, query, thread_id, after, limit))
+            return cursor.fetchall()
+
+    def search_sql(self, user_id, query, thread_id, after, limit):
+        # Headlines are only computed for the rows of the page
+        sql = [
+            "SELECT hits.id, hits.score, ts_headline('simple', m.content, hits.query, %s)",
+            "FROM (SELECT m.id, -ts_rank(m.search_vector, query)::float8 AS score, query",
+            "FROM chat_message m JOIN chat_thread t ON t.id = m.thread_id,",
+            "websearch_to_tsquery('simple', %s) query",
+            "WHERE m.search_vector @@ query AND (t.user1_id = %s OR t.user2_id = %s)",
+        ]
+        options = (
+            f'StartSel="{SNIPPET_START}", StopSel="{SNIPPET_END}", '
+            f"MaxWords={SNIPPET_WORDS * 2}, MinWords={SNIPPET_WORDS}"
+        )
+        params = [options, query, user_id, user_id]
+        if thread_id is not None:
+            sql.append("AND m.thread_id = %s")
+            params.append(thread_id)
+        sql.append(") hits JOIN chat_message m ON m.id = hits.id")
+        if after is not None:
+            sql.append("WHERE (hits.score, hits.id) > (%s, %s)")
+            params += [after[0], after[1]]
+        sql.append("ORDER BY hits.score, hits.id LIMIT %s")
+        params.append(limit)
+        return " ".join(sql), params
+
+
+BACKENDS = {
+    "sqlite": SQLiteSearch(),
+    "postgresql": PostgresSearch(),
+}
+
+
+def get_search_backend(vendor=None):
+    """The search backend for ``vendor`` (the default connection's by default), or None."""
+    return BACKENDS.get(vendor or connection.vendor)
+
+
+def search_supported(vendor=None):
+    return get_search_backend(vendor) is not None
+
+
+def render_snippet(snippet):
+    """HTML for a raw backend ``snippet``: the text escaped, its match markers as ``<mark>`` tags."""
+    return html.escape(snippet).replace(SNIPPET_START, "<mark>").replace(SNIPPET_END, "</mark>")
+
+
+def search_messages(user, query, thread_id=None, after=None, limit=20):
+    """
+    Messages matching ``query`` in the threads ``user`` takes part in, best
+    first, each with ``rank`` and ``snippet`` set. ``after`` is the
+    ``(rank, id)`` key of the last result of the previous page.
+    """
+    backend = get_search_backend()
+    if backend is None:
+        raise SearchUnavailable(f"Message search is not supported on {connection.vendor}.")
+
+    hits = backend.search(user.pk, query, thread_id, after, limit)
+    messages = Message.objects.select_related("sender").in_bulk([message_id for message_id, _, _ in hits])
+    results = []
+    for message_id, rank, snippet in hits:
+        message = messages[message_id]
+        message.rank, message.snippet = rank, render_snippet(snippet)
+        results.append(message)
+    return results
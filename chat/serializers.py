@@ -1,6 +1,9 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
-from .models import FriendRequest, Friendship, Thread, Message
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+
+from .auth import USERNAME_CLAIM
+from .models import FriendRequest, Friendship, Thread, Message, ReadReceipt
 
 User = get_user_model()
 
@@ -27,6 +30,16 @@ class RegisterSerializer(serializers.ModelSerializer):
         return user
 
 
+class ChatTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Embeds the username so WebSocket auth can skip the user query."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token[USERNAME_CLAIM] = user.get_username()
+        return token
+
+
 class FriendRequestSerializer(serializers.ModelSerializer):
     from_user = UserSerializer(read_only=True)
     to_user = UserSerializer(read_only=True)
@@ -53,4 +66,54 @@ class MessageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Message
-        fields = ["id", "thread", "sender", "content", "timestamp"]
+        fields = ["id", "uid", "seq", "thread", "sender", "content", "timestamp"]
+
+
+class MessageSearchResultSerializer(MessageSerializer):
+    rank = serializers.FloatField(read_only=True)
+    snippet = serializers.CharField(read_only=True)
+
+    class Meta(MessageSerializer.Meta):
+        fields = MessageSerializer.Meta.fields + ["rank", "snippet"]
+
+
+class LastMessageSerializer(serializers.ModelSerializer):
+    sender = serializers.StringRelatedField(read_only=True)
+
+    class Meta:
+        model = Message
+        fields = ["id", "uid", "sender", "content", "timestamp"]
+
+
+class InboxThreadSerializer(serializers.ModelSerializer):
+    """A thread as seen by the requesting user, for the inbox list."""
+
+    other_user = serializers.SerializerMethodField()
+    last_message = LastMessageSerializer(read_only=True)
+    unread_count = serializers.SerializerMethodField()
+    is_friend = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Thread
+        fields = [
+            "id", "other_user", "is_friend", "last_message", "unread_count", "last_activity_at", "message_count",
+        ]
+
+    def get_other_user(self, obj):
+        other = obj.get_other_user(self.context["request"].user)
+        return {"id": other.id, "username": other.username}
+
+    def get_is_friend(self, obj):
+        # Looked up for the whole page by InboxView
+        return obj.get_other_user(self.context["request"].user).id in self.context.get("friend_ids", ())
+
+    def get_unread_count(self, obj):
+        return obj.unread_count_for(self.context["request"].user)
+
+
+class ReadReceiptSerializer(serializers.ModelSerializer):
+    user = UserSerializer(read_only=True)
+
+    class Meta:
+        model = ReadReceipt
+        fields = ["user", "last_read_message_id", "updated_at"]
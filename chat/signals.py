@@ -0,0 +1,38 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from chat import friends
+from chat.auth import allow_user, deny_user
+from chat.events import notify_thread_deleted
+from chat.models import Friendship, Thread
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Thread)
+def thread_deleted(sender, instance, **kwargs):
+    thread_id, user_ids = instance.id, (instance.user1_id, instance.user2_id)
+    transaction.on_commit(lambda: notify_thread_deleted(thread_id, user_ids))
+
+
+@receiver(post_save, sender=Friendship)
+@receiver(post_delete, sender=Friendship)
+def friendship_changed(sender, instance, **kwargs):
+    user_ids = (instance.user_low_id, instance.user_high_id)
+    transaction.on_commit(lambda: friends.invalidate(*user_ids))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    # WebSocket auth trusts token claims, so deactivation has to be pushed
+    if instance.is_active:
+        allow_user(instance.pk)
+    else:
+        deny_user(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    deny_user(instance.pk)
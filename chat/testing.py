@@ -0,0 +1,37 @@
+"""
+Test helpers.
+
+``QueryBudgetMixin`` fails a test when a block of code or an endpoint runs
+more database queries than it is budgeted, so an N+1 regression breaks
+the build instead of a page::
+
+    class InboxQueryTests(QueryBudgetMixin, TestCase):
+        def test_budgets(self):
+            self.assertEndpointBudgets(self.client, {
+                ("get", "/api/inbox/"): 3,
+                ("get", f"/api/threads/{thread.id}/messages/"): 4,
+            })
+"""
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    @contextmanager
+    def assertQueryBudget(self, budget, using="default"):
+        """Fail if the block runs more than ``budget`` queries, listing them."""
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        if len(context) > budget:
+            queries = "\n".join(f"{number}. {query['sql']}" for number, query in enumerate(context.captured_queries, 1))
+            self.fail(f"{len(context)} queries, budget {budget}:\n{queries}")
+
+    def assertEndpointBudgets(self, client, budgets, using="default"):
+        """``budgets`` maps ``(method, url)`` to a query budget; each request must also succeed."""
+        for (method, url), budget in budgets.items():
+            with self.subTest(method=method, url=url):
+                with self.assertQueryBudget(budget, using):
+                    response = getattr(client, method)(url)
+                self.assertLess(response.status_code, 400, f"{method.upper()} {url}")
@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from chat import archive
+from chat.models import Friendship, Message, Thread
+
+User = get_user_model()
+
+
+class ArchivePagingTests(APITestCase):
+    """Pages that cross from the message table into the archive return every message exactly once."""
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        alice = User.objects.create_user("alice")
+        bob = User.objects.create_user("bob")
+        Friendship.befriend(alice.id, bob.id)
+        self.thread, _ = Thread.open(alice, bob)
+
+        start = timezone.now() - timedelta(days=400)
+        # Messages 4 and 5 share a timestamp across a segment boundary, so the id breaks the tie
+        minutes = [0, 1, 2, 3, 3, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22]
+        for index, minute in enumerate(minutes):
+            sender = (alice, bob)[index % 2]
+            message = Message(thread=self.thread, sender=sender, content=f"m{index}",
+                              timestamp=start + timedelta(minutes=minute))
+            self.thread.add_message(message)
+            message.save()
+        self.ids = list(Message.objects.order_by("timestamp", "id").values_list("id", flat=True))
+
+        # The 14 oldest go to segments of 4, 4, 4 and 2 messages; the other 9 stay in the table
+        self.thread.refresh_from_db()
+        cutoff = start + timedelta(minutes=minutes[14])
+        while archive.archive_batch(self.thread, cutoff, batch_size=4):
+            pass
+        self.assertEqual(list(self.thread.archive_segments.values_list("message_count", flat=True)), [4, 4, 4, 2])
+        self.assertEqual(Message.objects.count(), 9)
+        self.client.force_authenticate(alice)
+
+    def walk(self, url, link):
+        """The ids of every page from ``url`` on, following the ``link`` of each page."""
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.append([row["id"] for row in response.json()["results"]])
+            url = response.json()[link]
+        return ids
+
+    def test_paging_back_from_the_latest_page(self):
+        for limit in (1, 4, 5, 9, 10, 50):
+            with self.subTest(limit=limit):
+                pages = self.walk(f"/api/threads/{self.thread.id}/messages/?limit={limit}", "previous")
+                self.assertEqual([message_id for page in reversed(pages) for message_id in page], self.ids)
+
+    def test_paging_forward_after_an_archived_message(self):
+        base = f"/api/threads/{self.thread.id}/messages/"
+        for position in (0, 3, 4, 11, 13, 14):
+            for limit in (1, 3, 10):
+                with self.subTest(position=position, limit=limit):
+                    pages = self.walk(f"{base}?since_id={self.ids[position]}&limit={limit}", "next")
+                    self.assertEqual([message_id for page in pages for message_id in page], self.ids[position + 1:])
+
+    def test_paging_back_before_an_archived_message(self):
+        response = self.client.get(f"/api/threads/{self.thread.id}/messages/?since_id={self.ids[8]}&limit=3")
+        self.assertEqual([row["id"] for row in response.json()["results"]], self.ids[9:12])
+        pages = self.walk(response.json()["previous"], "previous")
+        self.assertEqual([message_id for page in reversed(pages) for message_id in page], self.ids[:9])
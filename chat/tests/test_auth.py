@@ -0,0 +1,72 @@
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TransactionTestCase
+
+from chat import auth
+from chat.auth import JWTAuthMiddleware, access_token_for
+
+User = get_user_model()
+
+
+async def inner(scope, receive, send):
+    pass
+
+
+class JWTAuthMiddlewareTests(TransactionTestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.alice = User.objects.create_user("alice")
+        # The test settings use locmem; most tests stand in for a shared cache
+        shared = mock.patch("chat.auth.denylist_is_shared", return_value=True)
+        self.denylist_is_shared = shared.start()
+        self.addCleanup(shared.stop)
+
+    def authenticate(self, token):
+        scope = {"type": "websocket", "query_string": f"token={token}".encode(), "headers": []}
+        return async_to_sync(JWTAuthMiddleware(inner).authenticate)(scope)
+
+    def test_valid_token_is_trusted_without_loading_the_user(self):
+        with mock.patch("chat.auth.get_active_user") as get_active_user:
+            user = self.authenticate(access_token_for(self.alice))
+        get_active_user.assert_not_called()
+        self.assertEqual((user.pk, user.username), (self.alice.pk, "alice"))
+
+    def test_per_process_denylist_loads_the_user(self):
+        self.denylist_is_shared.return_value = False
+        user = self.authenticate(access_token_for(self.alice))
+        self.assertEqual(user, self.alice)
+        self.assertEqual(user.get_deferred_fields(), set())
+
+    def test_expired_and_invalid_tokens_are_refused(self):
+        token = access_token_for(self.alice)
+        token.set_exp(lifetime=-timedelta(seconds=1))
+        self.assertIsNone(self.authenticate(token))
+        self.assertIsNone(self.authenticate("not-a-token"))
+        self.assertIsNone(self.authenticate(str(access_token_for(self.alice))[:-2]))
+
+    def test_deactivated_user_is_refused_until_reactivated(self):
+        token = access_token_for(self.alice)
+        self.alice.is_active = False
+        self.alice.save()
+        self.assertIsNone(self.authenticate(token))
+
+        self.alice.is_active = True
+        self.alice.save()
+        self.assertIsNotNone(self.authenticate(token))
+
+    def test_deleted_user_is_refused(self):
+        token = access_token_for(self.alice)
+        self.alice.delete()
+        self.assertIsNone(self.authenticate(token))
+
+    def test_deleted_user_is_refused_with_a_per_process_denylist(self):
+        self.denylist_is_shared.return_value = False
+        token = access_token_for(self.alice)
+        self.alice.delete()
+        auth.denylist_cache().clear()  # as if another worker had handled the delete
+        self.assertIsNone(self.authenticate(token))
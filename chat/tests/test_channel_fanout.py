@@ -0,0 +1,142 @@
+"""
+Fan-out between workers over the Redis channel layer.
+
+The two sockets below are served by consumers on separate
+``RedisChannelLayer`` instances, as two uvicorn workers would be, so a
+message only reaches the other socket through Redis. The server is
+``CHAT_TEST_REDIS_URL`` (default: the first ``CHANNEL_REDIS_HOSTS`` entry,
+then ``redis://127.0.0.1:6379/0``); when nothing answers there an
+in-process fakeredis server stands in, and without fakeredis the tests are
+skipped.
+"""
+import json
+import os
+import socket
+import threading
+import unittest
+import uuid
+
+from channels.layers import channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TransactionTestCase, override_settings
+from django.urls import re_path
+
+from chat.auth import JWTAuthMiddleware, access_token_for
+from chat.consumers import ChatConsumer
+from chat.models import Friendship, Thread
+from chat.routing import websocket_urlpatterns
+
+User = get_user_model()
+
+PEER_ALIAS = "peer"
+
+
+class PeerChatConsumer(ChatConsumer):
+    """``ChatConsumer`` on a second channel layer instance, standing in for another worker."""
+
+    channel_layer_alias = PEER_ALIAS
+
+
+def make_application(urlpatterns):
+    return JWTAuthMiddleware(URLRouter(urlpatterns))
+
+
+def redis_available(url):
+    from redis import Redis
+    from redis.exceptions import RedisError
+
+    try:
+        return Redis.from_url(url, socket_connect_timeout=0.5).ping()
+    except RedisError:
+        return False
+
+
+def start_fake_redis():
+    """A fakeredis TCP server on a free port; returns (url, server) or None without fakeredis."""
+    try:
+        from fakeredis import TcpFakeServer
+    except ImportError:
+        return None
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"redis://127.0.0.1:{port}/0", server
+
+
+class ChannelFanoutTests(TransactionTestCase):
+    fake_redis = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.redis_url = os.getenv("CHAT_TEST_REDIS_URL") or next(
+            iter(settings.CHANNEL_REDIS_HOSTS), "redis://127.0.0.1:6379/0"
+        )
+        if not redis_available(cls.redis_url):
+            started = start_fake_redis()
+            if started is None:
+                raise unittest.SkipTest(f"No Redis at {cls.redis_url} and fakeredis is not installed.")
+            cls.redis_url, cls.fake_redis = started
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.fake_redis is not None:
+            cls.fake_redis.shutdown()
+            cls.fake_redis.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        layer = {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            # A prefix of its own keeps the test off any real data and lets flush() clean up
+            "CONFIG": {"hosts": [self.redis_url], "prefix": f"test-fanout-{uuid.uuid4().hex[:8]}"},
+        }
+        layers = override_settings(CHANNEL_LAYERS={"default": layer, PEER_ALIAS: layer})
+        layers.enable()
+        self.addCleanup(layers.disable)
+
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        Friendship.befriend(self.alice.id, self.bob.id)
+        self.thread, _ = Thread.open(self.alice, self.bob)
+
+    async def connect(self, application, user):
+        communicator = WebsocketCommunicator(
+            application, f"/ws/chat/{self.thread.id}/?token={access_token_for(user)}"
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def receive_message(self, communicator):
+        while True:
+            frame = json.loads(await communicator.receive_from(timeout=5))
+            if frame["type"] == "chat.message":
+                return frame
+
+    async def test_messages_fan_out_between_layer_instances(self):
+        self.assertIsNot(channel_layers[PEER_ALIAS], channel_layers["default"])
+        first = await self.connect(make_application(websocket_urlpatterns), self.alice)
+        second = await self.connect(
+            make_application([re_path(r"ws/chat/(?P<thread_id>\d+)/$", PeerChatConsumer.as_asgi())]), self.bob
+        )
+        try:
+            for sender, text in ((first, "to the peer"), (second, "and back")):
+                await sender.send_to(text_data=json.dumps({"message": text}))
+                # The group echoes to the sender as well, so both sockets see it in order
+                for communicator in (first, second):
+                    self.assertEqual((await self.receive_message(communicator))["message"], text)
+        finally:
+            await first.disconnect()
+            await second.disconnect()
+            for alias in ("default", PEER_ALIAS):
+                await channel_layers[alias].flush()
+                await channel_layers[alias].close_pools()
@@ -0,0 +1,64 @@
+import threading
+from unittest import mock
+
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import SimpleTestCase, TransactionTestCase
+
+from chat.auth import access_token_for
+from chat.consumers import SERVER_BUSY_CLOSE_CODE
+from chat.executor import DatabaseExecutor, ServerBusy
+from chat.models import Friendship, Thread
+from core.asgi import application
+
+User = get_user_model()
+
+
+def saturated_executor(test, workers=1, queue_size=1):
+    """A ``DatabaseExecutor`` whose threads and queue are all taken by calls blocked until cleanup."""
+    executor = DatabaseExecutor(workers, queue_size)
+    release = threading.Event()
+    for _ in range(workers + queue_size):
+        executor.submit(release.wait)
+    test.addCleanup(executor.shutdown)
+    test.addCleanup(release.set)
+    return executor, release
+
+
+class DatabaseExecutorTests(SimpleTestCase):
+    def test_saturated_pool_raises_server_busy(self):
+        executor, release = saturated_executor(self)
+        self.assertEqual(executor.queued, 1)
+        with self.assertRaises(ServerBusy):
+            executor.submit(lambda: None)
+
+        # Work that must not be dropped queues past the limit
+        unshed = executor.submit(lambda: "done", shed=False)
+        release.set()
+        self.assertEqual(unshed.result(timeout=5), "done")
+        self.assertEqual(executor.submit(lambda: "again").result(timeout=5), "again")
+
+
+class ServerBusyConsumerTests(TransactionTestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.alice = User.objects.create_user("alice")
+        bob = User.objects.create_user("bob")
+        Friendship.befriend(self.alice.id, bob.id)
+        self.thread, _ = Thread.open(self.alice, bob)
+        # Take the token's claims as they are, so authentication needs no executor call
+        patcher = mock.patch("chat.auth.denylist_is_shared", return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_connect_closes_with_1013_when_the_pool_is_saturated(self):
+        executor, _ = saturated_executor(self)
+        with mock.patch("chat.executor.get_database_executor", return_value=executor):
+            communicator = WebsocketCommunicator(
+                application, f"/ws/chat/{self.thread.id}/?token={access_token_for(self.alice)}"
+            )
+            connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, SERVER_BUSY_CLOSE_CODE)
@@ -0,0 +1,62 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from rest_framework.test import APITestCase
+
+from chat import friends
+from chat.models import FriendRequest, Friendship
+
+User = get_user_model()
+
+
+class FriendRequestTests(APITestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        # alice has the lower id, so requests below go both ways round the pair
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+
+    def assertFriends(self):
+        (friendship,) = Friendship.objects.all()
+        self.assertEqual((friendship.user_low_id, friendship.user_high_id), (self.alice.pk, self.bob.pk))
+        self.assertEqual(Friendship.friend_ids(self.alice.pk), [self.bob.pk])
+        self.assertEqual(Friendship.friend_ids(self.bob.pk), [self.alice.pk])
+        self.assertTrue(friends.are_friends(self.bob.pk, self.alice.pk))
+
+    def test_accept_in_both_directions(self):
+        for from_user, to_user in ((self.alice, self.bob), (self.bob, self.alice)):
+            with self.subTest(from_user=from_user.username):
+                Friendship.objects.all().delete()
+                FriendRequest.objects.all().delete()
+                friend_request = FriendRequest.objects.create(from_user=from_user, to_user=to_user)
+                self.assertTrue(friend_request.accept())
+                self.assertFriends()
+                # A second accept changes nothing
+                self.assertFalse(FriendRequest.objects.get(pk=friend_request.pk).accept())
+                self.assertFriends()
+
+    def test_accept_settles_the_reverse_request(self):
+        sent = FriendRequest.objects.create(from_user=self.alice, to_user=self.bob)
+        received = FriendRequest.objects.create(from_user=self.bob, to_user=self.alice)
+        self.assertTrue(received.accept())
+        self.assertTrue(FriendRequest.objects.get(pk=sent.pk).accepted)
+        self.assertFriends()
+
+    def test_mutual_requests_accept_each_other(self):
+        FriendRequest.objects.create(from_user=self.alice, to_user=self.bob)
+        self.client.force_authenticate(self.bob)
+        response = self.client.post("/api/friend-request/send/", {"to_user_id": self.alice.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(FriendRequest.objects.values_list("from_user", "accepted")), [(self.alice.pk, True)])
+        self.assertFriends()
+
+    def test_pairs_are_stored_once_low_id_first(self):
+        for user_low, user_high in ((self.bob, self.alice), (self.alice, self.alice)):
+            with self.subTest(user_low=user_low.username, user_high=user_high.username):
+                with self.assertRaises(IntegrityError), transaction.atomic():
+                    Friendship.objects.create(user_low=user_low, user_high=user_high)
+        Friendship.befriend(self.bob.pk, self.alice.pk)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Friendship.objects.create(user_low=self.alice, user_high=self.bob)
+        self.assertFriends()
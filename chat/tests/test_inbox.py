@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from rest_framework.test import APITestCase
+
+from chat.models import Friendship, Thread
+
+User = get_user_model()
+
+
+class InboxFriendshipTests(APITestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        self.carol = User.objects.create_user("carol")
+        Friendship.befriend(self.alice.id, self.bob.id)
+        Thread.open(self.alice, self.bob)
+        Thread.open(self.alice, self.carol)
+        self.client.force_authenticate(self.alice)
+
+    def test_threads_say_whether_the_other_user_is_a_friend(self):
+        response = self.client.get("/api/inbox/")
+        self.assertEqual(response.status_code, 200)
+        is_friend = {row["other_user"]["username"]: row["is_friend"] for row in response.json()["results"]}
+        self.assertEqual(is_friend, {"bob": True, "carol": False})
@@ -0,0 +1,59 @@
+import json
+
+import msgpack
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TransactionTestCase
+
+from chat.auth import access_token_for
+from chat.models import Friendship, Thread
+from core.asgi import application
+
+User = get_user_model()
+
+
+class MalformedFrameTests(TransactionTestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        Friendship.befriend(self.alice.id, self.bob.id)
+        self.thread, _ = Thread.open(self.alice, self.bob)
+
+    async def connect(self, subprotocols=None):
+        communicator = WebsocketCommunicator(
+            application,
+            f"/ws/chat/{self.thread.id}/?token={access_token_for(self.alice)}",
+            subprotocols=subprotocols,
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def receive_error(self, communicator, decode):
+        while True:
+            frame = decode(await communicator.receive_output())
+            if frame.get("type", frame.get("t")) == "error":
+                return frame
+
+    async def test_json_socket_reports_malformed_frames_and_stays_open(self):
+        communicator = await self.connect()
+        decode = lambda output: json.loads(output["text"])
+        for kwargs in ({"text_data": "{not json"}, {"text_data": "[1, 2]"}, {"bytes_data": b"\xff\xfe"}):
+            await communicator.send_to(**kwargs)
+            self.assertEqual((await self.receive_error(communicator, decode))["message"], "Malformed frame.")
+
+        await communicator.send_to(text_data=json.dumps({"message": "still here"}))
+        while json.loads(await communicator.receive_from())["type"] != "chat.message":
+            pass
+        await communicator.disconnect()
+
+    async def test_msgpack_socket_reports_malformed_frames(self):
+        communicator = await self.connect(["chat.msgpack"])
+        decode = lambda output: msgpack.unpackb(output["bytes"])
+        for payload in (b"\xc1", b"\x92", msgpack.packb([1, 2]), b"\xa2\xff\xfe"):
+            await communicator.send_to(bytes_data=payload)
+            self.assertEqual((await self.receive_error(communicator, decode))["m"], "Malformed frame.")
+        await communicator.disconnect()
@@ -0,0 +1,117 @@
+import json
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MigrationTestCase(TransactionTestCase):
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+
+class FriendshipPairMigrationTests(MigrationTestCase):
+    """0010 folds each pair's two (user, friend) rows into one, and splits them again backwards."""
+
+    before = [("chat", "0009_message_archive")]
+    after = [("chat", "0010_friendship_pair")]
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    def befriend(self, Friendship, user, friend, minute):
+        friendship = Friendship.objects.create(user=user, friend=friend)
+        # created_at is auto_now_add
+        Friendship.objects.filter(pk=friendship.pk).update(created_at=self.start + timedelta(minutes=minute))
+
+    def test_pairs_are_merged_and_split(self):
+        apps = self.migrate(self.before)
+        User = apps.get_model("auth", "User")
+        Friendship = apps.get_model("chat", "Friendship")
+        alice, bob, carol = (User.objects.create(username=name) for name in ("alice", "bob", "carol"))
+        self.befriend(Friendship, bob, alice, 5)
+        self.befriend(Friendship, alice, bob, 1)
+        self.befriend(Friendship, carol, alice, 2)
+        self.befriend(Friendship, carol, carol, 3)
+
+        apps = self.migrate(self.after)
+        Friendship = apps.get_model("chat", "Friendship")
+        pairs = Friendship.objects.order_by("user_low", "user_high").values_list("user_low", "user_high", "created_at")
+        self.assertEqual(list(pairs), [
+            (alice.pk, bob.pk, self.start + timedelta(minutes=1)),
+            (alice.pk, carol.pk, self.start + timedelta(minutes=2)),
+        ])
+
+        apps = self.migrate(self.before)
+        Friendship = apps.get_model("chat", "Friendship")
+        rows = Friendship.objects.order_by("user", "friend").values_list("user", "friend", "created_at")
+        self.assertEqual(list(rows), [
+            (alice.pk, bob.pk, self.start + timedelta(minutes=1)),
+            (alice.pk, carol.pk, self.start + timedelta(minutes=2)),
+            (bob.pk, alice.pk, self.start + timedelta(minutes=1)),
+            (carol.pk, alice.pk, self.start + timedelta(minutes=2)),
+        ])
+
+
+class ThreadPairMigrationTests(MigrationTestCase):
+    """0011 merges a pair's two threads, archived messages included."""
+
+    before = [("chat", "0010_friendship_pair")]
+    after = [("chat", "0011_thread_pair")]
+
+    def test_archived_messages_are_renumbered_with_the_merged_history(self):
+        apps = self.migrate(self.before)
+        User = apps.get_model("auth", "User")
+        Thread = apps.get_model("chat", "Thread")
+        Message = apps.get_model("chat", "Message")
+        MessageArchiveSegment = apps.get_model("chat", "MessageArchiveSegment")
+
+        alice = User.objects.create(username="alice")
+        bob = User.objects.create(username="bob")
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+        def thread(user1, user2, times):
+            """A thread with messages at ``times`` (minutes), all but the last archived."""
+            thread = Thread.objects.create(user1=user1, user2=user2, last_activity_at=start, last_seq=len(times),
+                                           message_count=len(times))
+            messages = [
+                Message(thread=thread, sender=user1, content=f"{user1.username}{minute}", seq=seq,
+                        uid=uuid.uuid4(), timestamp=start + timedelta(minutes=minute))
+                for seq, minute in enumerate(times, 1)
+            ]
+            Message.objects.bulk_create(messages)
+            messages = list(Message.objects.filter(thread=thread).order_by("seq"))
+            archived = messages[:-1]
+            rows = [[m.id, str(m.uid), m.seq, m.sender_id, m.content, m.timestamp.isoformat()] for m in archived]
+            MessageArchiveSegment.objects.create(
+                thread=thread,
+                first_timestamp=archived[0].timestamp, first_message_id=archived[0].id,
+                last_timestamp=archived[-1].timestamp, last_message_id=archived[-1].id,
+                min_message_id=archived[0].id, max_message_id=archived[-1].id,
+                message_count=len(archived), codec="zlib", data=zlib.compress(json.dumps(rows).encode()),
+            )
+            Message.objects.filter(pk__in=[m.pk for m in archived]).delete()
+            return thread
+
+        keep = thread(alice, bob, [0, 2, 4])
+        thread(bob, alice, [1, 3, 5])
+
+        apps = self.migrate(self.after)
+        Thread = apps.get_model("chat", "Thread")
+        Message = apps.get_model("chat", "Message")
+        MessageArchiveSegment = apps.get_model("chat", "MessageArchiveSegment")
+
+        merged = Thread.objects.get()
+        self.assertEqual(merged.pk, keep.pk)
+        self.assertFalse(MessageArchiveSegment.objects.exists())
+        history = list(Message.objects.filter(thread=merged).order_by("seq").values_list("seq", "content"))
+        self.assertEqual(history, [(1, "alice0"), (2, "bob1"), (3, "alice2"), (4, "bob3"), (5, "alice4"), (6, "bob5")])
+        self.assertEqual(merged.last_seq, 6)
+        self.assertEqual(merged.message_count, 6)
@@ -0,0 +1,84 @@
+import threading
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+
+from chat.models import Friendship, Message, Thread
+
+User = get_user_model()
+
+
+class ThreadCounterTests(TransactionTestCase):
+    """``message_count``, ``last_seq`` and the inbox preview stay in step with the messages."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        Friendship.befriend(self.alice.id, self.bob.id)
+        self.thread, _ = Thread.open(self.alice, self.bob)
+
+    def send(self, thread, sender, content):
+        message = Message(thread=thread, sender=sender, content=content)
+        with transaction.atomic():
+            self.assertTrue(thread.add_message(message))
+            message.save()
+        return message
+
+    def assertCountersMatch(self, thread):
+        thread.refresh_from_db()
+        messages = list(thread.messages.order_by("seq"))
+        self.assertEqual([message.seq for message in messages], list(range(1, len(messages) + 1)))
+        self.assertEqual(thread.message_count, len(messages))
+        self.assertEqual(thread.last_seq, len(messages))
+        newest = max(messages, key=lambda message: (message.timestamp, message.seq))
+        self.assertEqual(thread.last_message_id, newest.uid)
+
+    def test_interleaved_sends_from_stale_instances(self):
+        for returning in (True, False):
+            with self.subTest(update_returning=returning), \
+                    mock.patch("chat.models.can_update_returning", return_value=returning):
+                # Each sender holds the thread as loaded before the other's sends
+                alices, bobs = Thread.objects.get(pk=self.thread.pk), Thread.objects.get(pk=self.thread.pk)
+                for index in range(3):
+                    self.send(alices, self.alice, f"from alice {index}")
+                    self.send(bobs, self.bob, f"from bob {index}")
+                self.assertCountersMatch(self.thread)
+                self.assertEqual(self.thread.user1_unread_count + self.thread.user2_unread_count, 1)
+
+    def test_limit_stops_at_the_count(self):
+        for index in range(3):
+            self.send(self.thread, self.alice, f"hello {index}")
+        self.assertFalse(self.thread.add_message(Message(thread=self.thread, sender=self.bob), limit=3))
+        self.assertCountersMatch(self.thread)
+
+    def test_concurrent_sends(self):
+        if connection.vendor == "sqlite":
+            # The in-memory test database fails concurrent writers instead of queueing them
+            self.skipTest("SQLite test databases do not take concurrent writers.")
+        senders, per_sender = 4, 10
+        barrier = threading.Barrier(senders)
+        errors = []
+
+        def sender(user):
+            try:
+                thread = Thread.objects.get(pk=self.thread.pk)
+                barrier.wait()
+                for index in range(per_sender):
+                    self.send(thread, user, f"{user.username} {index}")
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=sender, args=(user,)) for user in [self.alice, self.bob] * (senders // 2)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+        self.assertCountersMatch(self.thread)
+        self.assertEqual(self.thread.message_count, senders * per_sender)
@@ -0,0 +1,69 @@
+import asyncio
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from chat.consumers import ChatConsumer
+from chat.outbox import SLOW_CONSUMER_CLOSE_CODE, Outbox
+
+
+def frame(text):
+    return {"text_data": text}
+
+
+class OutboxTests(SimpleTestCase):
+    async def drain(self, outbox):
+        return [(await outbox.get())["text_data"] for _ in range(len(outbox))]
+
+    async def test_below_high_water_everything_is_queued_in_order(self):
+        outbox = Outbox(high_water=10, limit=20)
+        self.assertTrue(outbox.put(frame("message 1")))
+        self.assertTrue(outbox.put(frame("typing"), ephemeral=True))
+        self.assertTrue(outbox.put(frame("read 1"), key="read:1"))
+        self.assertTrue(outbox.put(frame("read 2"), key="read:1"))
+        self.assertEqual(await self.drain(outbox), ["message 1", "typing", "read 1", "read 2"])
+
+    async def test_above_high_water_ephemeral_frames_are_shed(self):
+        outbox = Outbox(high_water=3, limit=10)
+        outbox.put(frame("message 1"))
+        outbox.put(frame("typing 1"), ephemeral=True)
+        outbox.put(frame("message 2"))
+        # The queue is at high water: new ephemeral frames are dropped, queued ones go with the next frame
+        self.assertTrue(outbox.put(frame("typing 2"), ephemeral=True))
+        self.assertEqual(len(outbox), 3)
+        self.assertTrue(outbox.put(frame("message 3")))
+        self.assertEqual(await self.drain(outbox), ["message 1", "message 2", "message 3"])
+
+    async def test_above_high_water_keyed_frames_replace_the_queued_one(self):
+        outbox = Outbox(high_water=2, limit=10)
+        outbox.put(frame("read 1"), key="read:1")
+        outbox.put(frame("message 1"))
+        self.assertTrue(outbox.put(frame("read 2"), key="read:1"))
+        self.assertTrue(outbox.put(frame("read 9"), key="read:9"))
+        self.assertEqual(await self.drain(outbox), ["read 2", "message 1", "read 9"])
+        # Once sent, a key starts a new frame again
+        outbox.put(frame("read 3"), key="read:1")
+        self.assertEqual(await self.drain(outbox), ["read 3"])
+
+    async def test_put_fails_at_the_limit(self):
+        outbox = Outbox(high_water=1, limit=3)
+        for index in range(3):
+            self.assertTrue(outbox.put(frame(f"message {index}")))
+        self.assertFalse(outbox.put(frame("message 3")))
+        self.assertFalse(outbox.put(frame("read"), key="read:1"))
+        self.assertEqual(len(outbox), 3)
+
+    async def test_consumer_closes_at_the_limit(self):
+        consumer = ChatConsumer()
+        consumer.outbox = Outbox(high_water=1, limit=1)
+        consumer.outbox_task = asyncio.create_task(asyncio.sleep(60))
+        consumer.close = mock.AsyncMock()
+        await consumer.push(frame("message 1"))
+        consumer.close.assert_not_called()
+
+        await consumer.push(frame("message 2"))
+        consumer.close.assert_awaited_once()
+        self.assertEqual(consumer.close.call_args.kwargs["code"], SLOW_CONSUMER_CLOSE_CODE)
+        self.assertEqual(len(consumer.outbox), 0)
+        await asyncio.sleep(0)
+        self.assertTrue(consumer.outbox_task.cancelled())
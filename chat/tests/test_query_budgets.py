@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from rest_framework.test import APITestCase
+
+from chat.models import Friendship, Message, Thread
+from chat.testing import QueryBudgetMixin
+
+User = get_user_model()
+
+
+class EndpointQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """The budgets do not grow with the number of threads or messages on a page."""
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.alice = User.objects.create_user("alice")
+        self.threads = []
+        for index in range(5):
+            friend = User.objects.create_user(f"friend{index}")
+            if index % 2:
+                Friendship.befriend(self.alice.id, friend.id)
+            thread, _ = Thread.open(self.alice, friend)
+            first = thread.allocate_seqs(30)
+            messages = Message.objects.bulk_create(
+                Message(thread=thread, sender=sender, content=f"hello {seq}", seq=seq)
+                for seq, sender in zip(range(first, first + 30), [self.alice, friend] * 15)
+            )
+            thread.record_messages(messages)
+            self.threads.append(thread)
+        self.client.force_authenticate(self.alice)
+
+    def test_inbox(self):
+        # The page of threads, and the friend ids for is_friend on a cold cache
+        self.assertEndpointBudgets(self.client, {("get", "/api/inbox/"): 2})
+
+    def test_message_list(self):
+        thread = self.threads[0]
+        oldest = thread.messages.order_by("seq").first()
+        self.assertEndpointBudgets(self.client, {
+            # A cache miss fills the recent-messages cache, the second request is served from it
+            ("get", f"/api/threads/{thread.id}/messages/"): 4,
+            ("get", f"/api/threads/{thread.id}/messages/?limit=20"): 3,
+            ("get", f"/api/threads/{thread.id}/messages/?since_id={oldest.id}"): 6,
+        })
+
+    def test_search(self):
+        self.assertEndpointBudgets(self.client, {
+            ("get", "/api/messages/search/?q=hello"): 2,
+            ("get", f"/api/messages/search/?q=hello&thread={self.threads[0].id}"): 2,
+        })
@@ -0,0 +1,60 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from chat.ratelimit import ConnectionRateLimiter, TokenBucket, take_user_token
+
+LIMITS = {"message": {"connection": (2.0, 3), "user": (1.0, 2)}}
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_then_rejection(self):
+        bucket = TokenBucket(rate=2.0, burst=3)
+        self.assertEqual([bucket.take(100.0) for _ in range(3)], [0.0, 0.0, 0.0])
+        # Empty: a token is half a second away at 2 per second
+        self.assertEqual(bucket.take(100.0), 0.5)
+        self.assertEqual(bucket.take(100.25), 0.25)
+
+    def test_refill(self):
+        bucket = TokenBucket(rate=2.0, burst=3)
+        for _ in range(3):
+            bucket.take(100.0)
+        self.assertEqual(bucket.take(100.5), 0.0)
+        self.assertGreater(bucket.take(100.5), 0)
+        # Refills stop at burst however long the bucket sits idle
+        self.assertEqual([bucket.take(1000.0) for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertGreater(bucket.take(1000.0), 0)
+
+
+@override_settings(CHAT_RATE_LIMITS_ENABLED=True, CHAT_RATE_LIMITS=LIMITS)
+class RateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_connection_bucket(self):
+        limiter = ConnectionRateLimiter()
+        with mock.patch("chat.ratelimit.time.monotonic", return_value=50.0) as monotonic:
+            self.assertEqual([limiter.take("message") for _ in range(3)], [0.0, 0.0, 0.0])
+            self.assertEqual(limiter.take("message"), 0.5)
+            monotonic.return_value = 51.0
+            self.assertEqual([limiter.take("message") for _ in range(2)], [0.0, 0.0])
+            self.assertGreater(limiter.take("message"), 0)
+        # Events without a limit are never rejected
+        self.assertEqual([limiter.take("read") for _ in range(100)], [0.0] * 100)
+
+    def test_user_bucket_is_shared_through_the_cache(self):
+        with mock.patch("chat.ratelimit.time.time", return_value=50.0) as now:
+            self.assertEqual([take_user_token(1, "message") for _ in range(2)], [0.0, 0.0])
+            self.assertEqual(take_user_token(1, "message"), 1.0)
+            # Another user has a bucket of their own
+            self.assertEqual(take_user_token(2, "message"), 0.0)
+            now.return_value = 51.0
+            self.assertEqual(take_user_token(1, "message"), 0.0)
+            self.assertGreater(take_user_token(1, "message"), 0)
+
+    @override_settings(CHAT_RATE_LIMITS_ENABLED=False)
+    def test_disabled(self):
+        limiter = ConnectionRateLimiter()
+        self.assertEqual([limiter.take("message") for _ in range(10)], [0.0] * 10)
+        self.assertEqual([take_user_token(1, "message") for _ in range(10)], [0.0] * 10)
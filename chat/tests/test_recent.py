@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from chat import recent
+from chat.models import Friendship, Message, Thread
+
+User = get_user_model()
+
+
+@override_settings(CHAT_RECENT_MESSAGES={"CACHE": "chat_recent", "PER_THREAD": 10, "MAX_ENTRY_BYTES": 2000})
+class RecentMessagesSizeTests(TestCase):
+    def setUp(self):
+        caches["chat_recent"].clear()
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        Friendship.befriend(self.alice.id, self.bob.id)
+        self.thread, _ = Thread.open(self.alice, self.bob)
+
+    def send(self, *contents):
+        first = self.thread.allocate_seqs(len(contents))
+        messages = Message.objects.bulk_create(
+            Message(thread=self.thread, sender=self.alice, content=content, seq=first + offset)
+            for offset, content in enumerate(contents)
+        )
+        self.thread.refresh_from_db()
+        return messages
+
+    def test_entry_is_trimmed_to_max_entry_bytes(self):
+        messages = self.send(*(f"{index}" * 400 for index in range(6)))
+        rows = recent.fill(self.thread, messages, complete=True)
+        self.assertEqual(len(rows), 6)
+
+        entry = caches["chat_recent"].get(recent.KEY.format(self.thread.pk))
+        kept = len(entry["messages"])
+        self.assertFalse(entry["complete"])
+        self.assertTrue(0 < kept < 6)
+        self.assertEqual(entry["messages"], rows[-kept:])
+        self.assertEqual(entry["last_seq"], messages[-1].seq)
+
+        # Pages that fit in what is left are still served, longer ones go to the database
+        self.assertEqual(recent.get(self.thread, kept), (entry["messages"], True))
+        self.assertIsNone(recent.get(self.thread, kept + 1))
+
+    def test_small_entries_are_complete(self):
+        messages = self.send("hi", "there")
+        recent.fill(self.thread, messages, complete=True)
+        rows, has_more = recent.get(self.thread, 10)
+        self.assertEqual([row["content"] for row in rows], ["hi", "there"])
+        self.assertFalse(has_more)
+        self.assertEqual(recent.get(self.thread, 1), (rows[1:], True))
+
+    def test_append_out_of_key_order_drops_the_entry(self):
+        first, second = self.send("first", "second")
+        recent.fill(self.thread, [first, second], complete=True)
+
+        # Timestamped before "second" but numbered after it, as concurrent sends can be
+        (late,) = self.send("late")
+        Message.objects.filter(pk=late.pk).update(timestamp=second.timestamp - timedelta(seconds=1))
+        late.refresh_from_db()
+        recent.append(self.thread.pk, recent.serialize([late]))
+        self.assertIsNone(recent.get(self.thread, 3))
+
+        (last,) = self.send("last")
+        recent.append(self.thread.pk, recent.serialize([last]))
+        self.assertIsNone(recent.get(self.thread, 3))
+
+    def test_append_in_key_order_extends_the_entry(self):
+        messages = self.send("first", "second")
+        recent.fill(self.thread, messages, complete=True)
+        (third,) = self.send("third")
+        recent.append(self.thread.pk, recent.serialize([third]))
+        rows, has_more = recent.get(self.thread, 3)
+        self.assertEqual([row["content"] for row in rows], ["first", "second", "third"])
+        self.assertFalse(has_more)
@@ -0,0 +1,71 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from rest_framework.test import APITestCase
+
+from chat import search
+from chat.models import Friendship, Message, Thread
+
+User = get_user_model()
+
+
+class SearchAvailabilityTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_user("alice"))
+
+    def test_unsupported_database_answers_501(self):
+        with mock.patch.dict(search.BACKENDS, clear=True):
+            response = self.client.get("/api/messages/search/", {"q": "hello"})
+        self.assertEqual(response.status_code, 501)
+
+    def test_search_messages_raises_search_unavailable(self):
+        user = User.objects.get(username="alice")
+        with mock.patch.dict(search.BACKENDS, clear=True), self.assertRaises(search.SearchUnavailable):
+            search.search_messages(user, "hello")
+
+    def test_supported_database_searches(self):
+        response = self.client.get("/api/messages/search/", {"q": "hello"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [])
+
+
+class SnippetEscapingTests(APITestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice")
+        bob = User.objects.create_user("bob")
+        Friendship.befriend(self.alice.id, bob.id)
+        thread, _ = Thread.open(self.alice, bob)
+        message = Message(thread=thread, sender=bob, content='<img src=x onerror="alert(1)"> hello & bye')
+        thread.add_message(message)
+        message.save()
+        self.client.force_authenticate(self.alice)
+
+    def test_snippet_escapes_content_and_marks_matches(self):
+        response = self.client.get("/api/messages/search/", {"q": "hello"})
+        self.assertEqual(response.status_code, 200)
+        (result,) = response.json()["results"]
+        self.assertEqual(
+            result["snippet"], "&lt;img src=x onerror=&quot;alert(1)&quot;&gt; <mark>hello</mark> &amp; bye"
+        )
+
+    def test_postgresql_headline_uses_markers(self):
+        sql, params = search.PostgresSearch().search_sql(self.alice.pk, "hello", 7, (-0.5, 3), 20)
+        self.assertIn("ts_headline('simple', m.content, hits.query, %s)", sql)
+        self.assertEqual(sql.count("%s"), len(params))
+        self.assertEqual(
+            params,
+            [
+                f'StartSel="{search.SNIPPET_START}", StopSel="{search.SNIPPET_END}", MaxWords=24, MinWords=12',
+                "hello", self.alice.pk, self.alice.pk, 7, -0.5, 3, 20,
+            ],
+        )
+
+    def test_postgresql_snippets_are_escaped(self):
+        message = Message.objects.get()
+        headline = f"&lt;b&gt; {search.SNIPPET_START}<b>hello</b>{search.SNIPPET_END}"
+        # The PostgreSQL backend in place of this database's, returning what ts_headline would
+        with mock.patch.dict(search.BACKENDS, {"sqlite": search.PostgresSearch()}), mock.patch.object(
+            search.PostgresSearch, "search", return_value=[(message.id, -0.5, headline)]
+        ):
+            (result,) = search.search_messages(self.alice, "hello")
+        self.assertEqual(result.snippet, "&amp;lt;b&amp;gt; <mark>&lt;b&gt;hello&lt;/b&gt;</mark>")
@@ -0,0 +1,54 @@
+import json
+from unittest import mock
+
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TransactionTestCase
+
+from chat.auth import access_token_for
+from chat.models import Friendship, Thread
+from core.asgi import application
+
+User = get_user_model()
+
+
+class ThreadDeletedTests(TransactionTestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        self.carol = User.objects.create_user("carol")
+        Friendship.befriend(self.alice.id, self.bob.id)
+        self.thread, _ = Thread.open(self.alice, self.bob)
+        self.other_thread, _ = Thread.open(self.alice, self.carol)
+        patcher = mock.patch("chat.auth.denylist_is_shared", return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def connect(self, path, user):
+        communicator = WebsocketCommunicator(application, f"{path}?token={access_token_for(user)}")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_unsubscribed_connection_is_told(self):
+        alice = await self.connect("/ws/chat/", self.alice)
+        thread_id = self.thread.id
+        await self.thread.adelete()
+        self.assertEqual(json.loads(await alice.receive_from()), {"type": "thread_deleted", "thread_id": thread_id})
+        await alice.disconnect()
+
+    async def test_thread_socket_closes_only_for_its_own_thread(self):
+        bob = await self.connect(f"/ws/chat/{self.thread.id}/", self.bob)
+        alice = await self.connect(f"/ws/chat/{self.thread.id}/", self.alice)
+        await self.other_thread.adelete()
+        self.assertTrue(await alice.receive_nothing())
+
+        await self.thread.adelete()
+        for communicator in (alice, bob):
+            # Skipping presence frames sent on connect
+            while (output := await communicator.receive_output())["type"] == "websocket.send":
+                pass
+            self.assertEqual(output["type"], "websocket.close")
@@ -0,0 +1,75 @@
+import json
+
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TransactionTestCase, override_settings
+
+from chat.auth import access_token_for
+from chat.models import Friendship, Message, Thread
+from chat.persistence import drain_message_writer
+from core.asgi import application
+
+User = get_user_model()
+
+
+@override_settings(CHAT_WRITE_BEHIND={"ENABLED": True, "BATCH_SIZE": 10, "FLUSH_INTERVAL": 0.01, "ACK": "broadcast"})
+class WriteBehindTests(TransactionTestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        Friendship.befriend(self.alice.id, self.bob.id)
+        self.thread, _ = Thread.open(self.alice, self.bob)
+
+    async def connect(self, user, query=""):
+        communicator = WebsocketCommunicator(
+            application, f"/ws/chat/{self.thread.id}/?token={access_token_for(user)}{query}"
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def receive(self, communicator, kind):
+        while True:
+            frame = json.loads(await communicator.receive_from())
+            if frame["type"] == kind:
+                return frame
+
+    async def test_recipients_get_the_id_once_persisted(self):
+        alice = await self.connect(self.alice)
+        bob = await self.connect(self.bob)
+        await alice.send_to(text_data=json.dumps({"message": "hi"}))
+
+        broadcast = await self.receive(bob, "chat.message")
+        self.assertIsNone(broadcast["id"])
+        self.assertIsNone(broadcast["seq"])
+        persisted = await self.receive(bob, "persisted")
+
+        message = await Message.objects.aget(uid=broadcast["uid"])
+        self.assertEqual(persisted["thread_id"], self.thread.id)
+        self.assertEqual(persisted["messages"], [{"uid": broadcast["uid"], "id": message.id, "seq": message.seq}])
+
+        await alice.disconnect()
+        await bob.disconnect()
+        await drain_message_writer()
+
+    @override_settings(CHAT_WRITE_BEHIND={"ENABLED": True, "BATCH_SIZE": 100, "FLUSH_INTERVAL": 60, "ACK": "broadcast"})
+    async def test_resume_replays_messages_not_written_yet(self):
+        alice = await self.connect(self.alice)
+        await alice.send_to(text_data=json.dumps({"message": "queued"}))
+        broadcast = await self.receive(alice, "chat.message")
+        self.assertFalse(await Message.objects.filter(uid=broadcast["uid"]).aexists())
+
+        bob = await self.connect(self.bob, "&last_seq=0")
+        replayed = await self.receive(bob, "chat.message")
+        self.assertEqual((replayed["uid"], replayed["message"]), (broadcast["uid"], "queued"))
+
+        await drain_message_writer()
+        persisted = await self.receive(bob, "persisted")
+        self.assertEqual(persisted["messages"][0]["seq"], 1)
+        self.assertTrue(await bob.receive_nothing())
+
+        await alice.disconnect()
+        await bob.disconnect()
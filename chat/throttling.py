@@ -0,0 +1,16 @@
+from rest_framework.throttling import BaseThrottle
+
+from chat.ratelimit import take_user_token
+
+
+class MessageSendThrottle(BaseThrottle):
+    """Spends the per-user ``"message"`` bucket that the WebSocket consumers also use."""
+
+    def allow_request(self, request, view):
+        if not request.user.is_authenticated:
+            return True
+        self.retry_after = take_user_token(request.user.id, "message")
+        return not self.retry_after
+
+    def wait(self):
+        return self.retry_after
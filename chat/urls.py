@@ -5,10 +5,15 @@ from .views import (
     SendFriendRequestView,
     RespondFriendRequestView,
     ListFriendsView,
+    OnlineFriendsView,
     ListFriendRequestsView,
     ThreadListCreateView,
+    OpenThreadView,
+    InboxView,
     MessageListView,
     MessageCreateView,
+    ThreadReadView,
+    MessageSearchView,
 )
 
 urlpatterns = [
@@ -22,11 +27,16 @@ urlpatterns = [
     path("friend-request/respond/<int:pk>/", RespondFriendRequestView.as_view(), name="respond_friend_request"),
     path("friend-request/list/", ListFriendRequestsView.as_view(), name="list_friend_requests"),
     path("friends/", ListFriendsView.as_view(), name="list_friends"),
+    path("friends/online/", OnlineFriendsView.as_view(), name="online_friends"),
 
     # Threads
     path("threads/", ThreadListCreateView.as_view(), name="thread_list_create"),
+    path("threads/open/", OpenThreadView.as_view(), name="thread_open"),
+    path("inbox/", InboxView.as_view(), name="inbox"),
 
     # Messages
     path("threads/<int:thread_id>/messages/", MessageListView.as_view(), name="message_list"),
     path("threads/<int:thread_id>/messages/send/", MessageCreateView.as_view(), name="message_create"),
+    path("threads/<int:thread_id>/read/", ThreadReadView.as_view(), name="thread_read"),
+    path("messages/search/", MessageSearchView.as_view(), name="message_search"),
 ]
@@ -1,18 +1,38 @@
 # Create your views here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse
 from rest_framework import generics
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import FriendRequest, Friendship, Thread, Message
+from . import friends, metrics, recent
+from .events import notify_friend_request, notify_friendship_changed, notify_read, notify_thread_created
+from .models import FriendRequest, Friendship, Thread, Message, ReadReceipt, NON_FRIEND_MESSAGE_LIMIT
+from .pagination import InboxCursorPagination, MessageCursorPagination, SearchCursorPagination
+from .presence import get_presence_store
+from .search import search_messages, search_supported
 from .serializers import RegisterSerializer, UserSerializer, FriendRequestSerializer, ThreadSerializer, \
-    MessageSerializer
+    MessageSerializer, InboxThreadSerializer, ReadReceiptSerializer, MessageSearchResultSerializer
+from .throttling import MessageSendThrottle
 
 User = get_user_model()
 
 
+# --- Monitoring ---
+def metrics_view(request):
+    """This process's metrics in the Prometheus text format; bearer ``METRICS_TOKEN`` when one is set."""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if settings.METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {settings.METRICS_TOKEN}":
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # --- Registration ---
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
@@ -37,13 +57,27 @@ class SendFriendRequestView(APIView):
         except User.DoesNotExist:
             return Response({"detail": "User not found."}, status=404)
 
-        fr, created = FriendRequest.objects.get_or_create(
-            from_user=request.user, to_user=to_user
-        )
+        with transaction.atomic():
+            # Lock both users so crossing requests can't both end up pending
+            list(User.objects.select_for_update().filter(id__in=(request.user.id, to_user.id)).order_by("id"))
+            if Friendship.objects.filter(**Friendship.pair(request.user.id, to_user.id)).exists():
+                return Response({"detail": "You are already friends."}, status=400)
+
+            # A pending request the other way means both want it: accept that one
+            reverse = FriendRequest.objects.filter(from_user=to_user, to_user=request.user, accepted=False).first()
+            if reverse is not None:
+                reverse.accept()
+                transaction.on_commit(lambda: notify_friendship_changed(request.user, to_user))
+                return Response(FriendRequestSerializer(reverse).data)
+
+            fr, created = FriendRequest.objects.get_or_create(
+                from_user=request.user, to_user=to_user
+            )
 
         if not created:
             return Response({"detail": "Friend request already sent."}, status=400)
 
+        notify_friend_request(fr)
         return Response(FriendRequestSerializer(fr).data, status=201)
 
 
@@ -59,11 +93,8 @@ class RespondFriendRequestView(APIView):
 
         action = request.data.get("action")
         if action == "accept":
-            fr.accepted = True
-            fr.save()
-            # Create reciprocal friendships
-            Friendship.objects.get_or_create(user=fr.from_user, friend=fr.to_user)
-            Friendship.objects.get_or_create(user=fr.to_user, friend=fr.from_user)
+            if fr.accept():
+                notify_friendship_changed(fr.from_user, fr.to_user)
             return Response({"detail": "Friend request accepted."})
         elif action == "reject":
             fr.delete()
@@ -76,8 +107,17 @@ class ListFriendsView(generics.ListAPIView):
     serializer_class = UserSerializer
 
     def get_queryset(self):
-        friend_ids = Friendship.objects.filter(user=self.request.user).values_list("friend", flat=True)
-        return User.objects.filter(id__in=friend_ids)
+        return User.objects.filter(id__in=friends.friend_ids(self.request.user.id).tolist())
+
+
+class OnlineFriendsView(APIView):
+    """Ids of the caller's friends that currently hold a presence lease."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        online = async_to_sync(get_presence_store().online)(friends.friend_ids(request.user.id).tolist())
+        return Response({"online": sorted(online)})
 
 
 class ListFriendRequestsView(generics.ListAPIView):
@@ -94,7 +134,8 @@ class ThreadListCreateView(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Thread.objects.filter(user1=self.request.user) | Thread.objects.filter(user2=self.request.user)
+        threads = Thread.objects.filter(user1=self.request.user) | Thread.objects.filter(user2=self.request.user)
+        return threads.select_related("user1", "user2")
 
     def perform_create(self, serializer):
         user2_id = self.request.data.get("user2")
@@ -111,18 +152,82 @@ class ThreadListCreateView(generics.ListCreateAPIView):
         except User.DoesNotExist:
             raise PermissionDenied("User not found")
 
-        # Ensure thread doesn't already exist
-        existing = Thread.objects.filter(user1=self.request.user, user2=user2) | Thread.objects.filter(user1=user2, user2=self.request.user)
-        if existing.exists():
+        # Threads are stored with the lower user id first; the unique pair index rejects duplicates
+        user1, user2 = sorted((self.request.user, user2), key=lambda user: user.pk)
+        try:
+            with transaction.atomic():
+                thread = serializer.save(user1=user1, user2=user2)
+        except IntegrityError:
             raise PermissionDenied("Thread already exists")
+        notify_thread_created(thread)
+
+
+class OpenThreadView(APIView):
+    """
+    The caller's thread with ``user_id``, created if there is none yet:
+    200 with the existing thread, 201 with a new one. Safe to retry.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        user_id = request.data.get("user_id")
+        if not str(user_id).isdigit():
+            return Response({"detail": "user_id is required"}, status=400)
+        if int(user_id) == request.user.id:
+            return Response({"detail": "Cannot create thread with yourself"}, status=400)
+        try:
+            other = User.objects.get(id=user_id)
+        except User.DoesNotExist:
+            return Response({"detail": "User not found."}, status=404)
+
+        thread, created = Thread.open(request.user, other)
+        if created:
+            notify_thread_created(thread)
+        return Response(ThreadSerializer(thread).data, status=201 if created else 200)
+
+
+class InboxView(generics.ListAPIView):
+    """
+    The user's threads, most recently active first, each with the other
+    participant, whether they are a friend, the last message and the unread
+    count. One query per page: the preview and counts are denormalized on
+    ``Thread``, and friendship comes from the friend cache in one read.
+    """
+
+    serializer_class = InboxThreadSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = InboxCursorPagination
+    friend_ids = frozenset()
 
-        serializer.save(user1=self.request.user, user2=user2)
+    def get_queryset(self):
+        threads = Thread.objects.filter(user1=self.request.user) | Thread.objects.filter(user2=self.request.user)
+        return threads.select_related("user1", "user2", "last_message__sender")
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            user = self.request.user
+            self.friend_ids = friends.friends_among(user.id, [thread.get_other_user(user).id for thread in page])
+        return page
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), "friend_ids": self.friend_ids}
 
 
 # --- Messages ---
 class MessageListView(generics.ListAPIView):
+    """
+    Thread history. The default page holds the latest messages; older pages are fetched with
+    ``?before=<cursor>``, newer ones with ``?after=<cursor>`` or ``?since_id=<id>``.
+
+    The default page is served from the recent-messages cache (see ``chat.recent``)
+    and refilled from the database on a miss.
+    """
+
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = MessageCursorPagination
 
     def get_queryset(self):
         thread_id = self.kwargs["thread_id"]
@@ -134,12 +239,49 @@ class MessageListView(generics.ListAPIView):
         if not thread.is_participant(self.request.user):
             raise PermissionDenied("You are not a participant of this thread")
 
-        return thread.messages.all()
+        self.thread = thread
+        return thread.messages.select_related("sender")
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        cached = self.get_recent_rows(queryset)
+        if cached is None:
+            page = self.paginate_queryset(queryset)
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        rows, has_more = cached
+        return self.get_paginated_response(self.paginator.paginate_rows(rows, request, has_more))
+
+    def get_recent_rows(self, queryset):
+        """
+        The default page from the recent-messages cache and whether older
+        messages exist, refilling it on a miss; None for other pages.
+        """
+        paginator = self.paginator
+        if not paginator.is_latest_page(self.request):
+            return None
+
+        limit = paginator.get_limit(self.request)
+        cached = recent.get(self.thread, limit)
+        if cached is None:
+            config = recent.recent_settings()
+            if not config["ENABLED"] or limit > config["PER_THREAD"]:
+                return None
+            # In the paginator's key order; one extra row tells whether older ones exist
+            latest = list(queryset.order_by("-timestamp", "-id")[:config["PER_THREAD"] + 1])
+            complete = len(latest) <= config["PER_THREAD"]
+            if complete and len(latest) < self.thread.last_seq:
+                return None  # the rest are archived; let the paginator merge them in
+            latest = latest[:config["PER_THREAD"]]
+            rows = recent.fill(self.thread, latest[::-1], complete)
+            cached = rows[-limit:], len(rows) > limit or not complete
+        return cached
 
 
 class MessageCreateView(generics.CreateAPIView):
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated]
+    throttle_classes = [MessageSendThrottle]
 
     def perform_create(self, serializer):
         thread_id = self.kwargs["thread_id"]
@@ -151,11 +293,84 @@ class MessageCreateView(generics.CreateAPIView):
         if not thread.is_participant(self.request.user):
             raise PermissionDenied("You are not a participant of this thread")
 
-        # Enforce 20-message limit for non-friends
+        # Enforce the message limit for non-friends against the thread counter
         other_user = thread.get_other_user(self.request.user)
-        if not Friendship.are_friends(self.request.user, other_user):
-            total_messages = Message.count_between_nonfriends(self.request.user, other_user)
-            if total_messages >= 20:
+        is_friend = friends.are_friends(self.request.user.id, other_user.id)
+        draft = Message(thread=thread, sender=self.request.user)
+        with transaction.atomic():
+            if not thread.add_message(draft, limit=None if is_friend else NON_FRIEND_MESSAGE_LIMIT):
                 raise PermissionDenied("Message limit reached for non-friends")
+            message = serializer.save(
+                thread=thread, sender=self.request.user, uid=draft.uid, timestamp=draft.timestamp, seq=draft.seq
+            )
+            recent.write_through([message])
+
+
+class MessageSearchView(APIView):
+    """
+    Full-text search over the caller's threads: ``?q=<words>``, optionally
+    ``&thread=<id>``. Results are ranked best first with a highlighted
+    ``snippet``; the next page is at ``?after=<cursor>``.
+    """
+
+    permission_classes = [IsAuthenticated]
+    pagination_class = SearchCursorPagination
+
+    def get(self, request):
+        if not search_supported():
+            return Response({"detail": "Message search is not supported on this server."}, status=501)
+
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response({"detail": "q is required"}, status=400)
+
+        thread_id = request.query_params.get("thread")
+        if thread_id is not None:
+            try:
+                thread_id = int(thread_id)
+            except ValueError:
+                return Response({"detail": "thread must be a thread id"}, status=400)
+
+        paginator = self.pagination_class()
+        results = paginator.paginate_search(
+            lambda after, limit: search_messages(request.user, query, thread_id, after, limit), request
+        )
+        return paginator.get_paginated_response(MessageSearchResultSerializer(results, many=True).data)
+
+
+class ThreadReadView(APIView):
+    """Read cursors of a thread's participants; POST moves the caller's forward."""
 
-        serializer.save(thread=thread, sender=self.request.user)
+    permission_classes = [IsAuthenticated]
+
+    def get_thread(self, thread_id):
+        try:
+            thread = Thread.objects.get(id=thread_id)
+        except Thread.DoesNotExist:
+            raise PermissionDenied("Thread not found")
+
+        if not thread.is_participant(self.request.user):
+            raise PermissionDenied("You are not a participant of this thread")
+        return thread
+
+    def get(self, request, thread_id):
+        thread = self.get_thread(thread_id)
+        receipts = thread.read_receipts.select_related("user")
+        return Response(ReadReceiptSerializer(receipts, many=True).data)
+
+    def post(self, request, thread_id):
+        thread = self.get_thread(thread_id)
+        try:
+            message_id = int(request.data.get("message_id"))
+        except (TypeError, ValueError):
+            return Response({"detail": "message_id is required"}, status=400)
+
+        if ReadReceipt.advance(thread, request.user, message_id):
+            notify_read(thread.id, request.user, message_id)
+
+        thread.refresh_from_db(fields=["user1_unread_count", "user2_unread_count"])
+        receipt = ReadReceipt.objects.filter(thread=thread, user=request.user).first()
+        return Response({
+            "last_read_message_id": receipt.last_read_message_id if receipt else 0,
+            "unread_count": thread.unread_count_for(request.user),
+        })
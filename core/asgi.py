@@ -8,12 +8,28 @@ django.setup()
 
 # Import routing only after Django settings are configured
 import chat.routing
+from chat.auth import JWTAuthMiddleware
+from chat.persistence import drain_message_writer
 
 django_asgi_app = get_asgi_application()
 
+
+async def lifespan(scope, receive, send):
+    """Flush write-behind messages before the worker exits."""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await drain_message_writer()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
-    "websocket": URLRouter(
-        chat.routing.websocket_urlpatterns
+    "lifespan": lifespan,
+    "websocket": JWTAuthMiddleware(
+        URLRouter(chat.routing.websocket_urlpatterns)
     ),
 })
@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the whole stack
+    "chat.instrumentation.QueryMetricsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -85,12 +87,56 @@ ASGI_APPLICATION = "core.asgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_ENGINE=postgresql for production; SQLite takes one writer at a
+# time, so concurrent message inserts queue on its lock. PostgreSQL keeps
+# connections open for DATABASE_CONN_MAX_AGE seconds, checked before reuse,
+# or with POSTGRES_POOL=True borrows them from a psycopg pool per worker
+# process. Size POSTGRES_POOL_MAX_SIZE to CHAT_DB_WORKERS plus the threads
+# serving HTTP, and keep workers x max size under the server's max_connections.
+DATABASE_ENGINE = os.getenv("DATABASE_ENGINE", "sqlite")
+
+if DATABASE_ENGINE == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("POSTGRES_DB", "chat"),
+            "USER": os.getenv("POSTGRES_USER", "chat"),
+            "PASSWORD": os.getenv("POSTGRES_PASSWORD", ""),
+            "HOST": os.getenv("POSTGRES_HOST", "localhost"),
+            "PORT": os.getenv("POSTGRES_PORT", "5432"),
+            "CONN_MAX_AGE": int(os.getenv("DATABASE_CONN_MAX_AGE", "60")),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {},
+        }
     }
-}
+    if os.getenv("POSTGRES_POOL", "False") == "True":
+        # Pooled connections go back to the pool when closed; Django refuses
+        # to combine the pool with persistent connections
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": int(os.getenv("POSTGRES_POOL_MIN_SIZE", "4")),
+            "max_size": int(os.getenv("POSTGRES_POOL_MAX_SIZE", "40")),
+            # Seconds to wait for a free connection before raising
+            "timeout": float(os.getenv("POSTGRES_POOL_TIMEOUT", "10")),
+        }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+            "OPTIONS": {
+                # Seconds a write waits for the lock before "database is locked"
+                "timeout": float(os.getenv("SQLITE_BUSY_TIMEOUT", "20")),
+                # Take the write lock when the transaction starts, so two
+                # readers never deadlock upgrading to writers
+                "transaction_mode": "IMMEDIATE",
+            },
+        }
+    }
+    if os.getenv("SQLITE_WAL", "True") == "True":
+        # Readers no longer block the writer (or each other); WAL only has
+        # to be fsynced at checkpoints
+        DATABASES["default"]["OPTIONS"]["init_command"] = "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;"
 
 
 # Password validation
@@ -138,15 +184,162 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
-        # For Redis:
-        # "BACKEND": "channels_redis.core.RedisChannelLayer",
-        # "CONFIG": {"hosts": [("127.0.0.1", 6379)]},
+# Channel layer. The in-memory layer only fans out within one process; set
+# CHANNEL_REDIS_HOSTS to a comma-separated list of redis:// URLs to share
+# groups across workers. channels_redis shards channels and groups across
+# all listed hosts, so every worker must list the same hosts in the same order.
+CHANNEL_REDIS_HOSTS = [host for host in os.getenv("CHANNEL_REDIS_HOSTS", "").split(",") if host]
+
+if CHANNEL_REDIS_HOSTS:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": CHANNEL_REDIS_HOSTS,
+                "prefix": os.getenv("CHANNEL_LAYER_PREFIX", "asgi"),
+                # Messages queued per channel before new ones are dropped
+                "capacity": int(os.getenv("CHANNEL_LAYER_CAPACITY", "100")),
+                # Seconds an undelivered message is kept
+                "expiry": int(os.getenv("CHANNEL_LAYER_EXPIRY", "60")),
+                # Seconds a channel stays in a group without re-joining
+                "group_expiry": int(os.getenv("CHANNEL_LAYER_GROUP_EXPIRY", "86400")),
+            },
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer"
+        }
+    }
+
+# Caches. Set CACHE_REDIS_URL to share them (the JWT denylist, recent messages)
+# across workers; with a per-process denylist WebSocket auth reads the user row
+# on every connect instead of trusting the token's claims; give that Redis a maxmemory with the allkeys-lru policy to cap
+# it. Without it, "chat_recent" is a locmem cache that evicts the least recently
+# used threads past CHAT_RECENT_MESSAGES_MAX_THREADS; with the per-thread
+# CHAT_RECENT_MESSAGES_MAX_ENTRY_BYTES that caps it at about their product.
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "")
+
+if CACHE_REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_REDIS_URL,
+        },
+        "chat_recent": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_REDIS_URL,
+            "KEY_PREFIX": "recent",
+        },
     }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+        "chat_recent": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "chat-recent",
+            "OPTIONS": {
+                "MAX_ENTRIES": int(os.getenv("CHAT_RECENT_MESSAGES_MAX_THREADS", "1000")),
+            },
+        },
+    }
+
+# Opt-in write-behind persistence for WebSocket messages, see chat/persistence.py.
+# CHAT_WRITE_BEHIND_ACK is "flush" (ack once committed) or "broadcast" (ack once sent).
+CHAT_WRITE_BEHIND = {
+    "ENABLED": os.getenv("CHAT_WRITE_BEHIND", "False") == "True",
+    "BATCH_SIZE": int(os.getenv("CHAT_WRITE_BEHIND_BATCH_SIZE", "100")),
+    "FLUSH_INTERVAL": float(os.getenv("CHAT_WRITE_BEHIND_FLUSH_INTERVAL", "0.05")),
+    "ACK": os.getenv("CHAT_WRITE_BEHIND_ACK", "flush"),
+}
+
+# Read receipts from a WebSocket are coalesced and saved at most once per interval (seconds)
+CHAT_READ_RECEIPT_INTERVAL = float(os.getenv("CHAT_READ_RECEIPT_INTERVAL", "1.0"))
+
+# Most messages replayed to a socket resuming with last_seq; longer gaps get a "resync" frame
+CHAT_REPLAY_LIMIT = int(os.getenv("CHAT_REPLAY_LIMIT", "500"))
+
+# Recent-messages cache serving the first page of a thread's history, see chat/recent.py
+CHAT_RECENT_MESSAGES = {
+    "ENABLED": os.getenv("CHAT_RECENT_MESSAGES", "True") == "True",
+    "CACHE": "chat_recent",
+    "PER_THREAD": int(os.getenv("CHAT_RECENT_MESSAGES_PER_THREAD", "50")),
+    # Oldest messages are dropped from an entry past this much JSON
+    "MAX_ENTRY_BYTES": int(os.getenv("CHAT_RECENT_MESSAGES_MAX_ENTRY_BYTES", str(64 * 1024))),
+    "TIMEOUT": int(os.getenv("CHAT_RECENT_MESSAGES_TIMEOUT", "3600")),
 }
 
+# Messages older than AGE_DAYS are moved to compressed archive segments by
+# `manage.py archive_messages`, BATCH_SIZE messages per transaction (chat/archive.py)
+CHAT_ARCHIVE = {
+    "AGE_DAYS": int(os.getenv("CHAT_ARCHIVE_AGE_DAYS", "180")),
+    "BATCH_SIZE": int(os.getenv("CHAT_ARCHIVE_BATCH_SIZE", "500")),
+}
+
+# Each user's friend ids are cached as a sorted int array (see chat/friends.py);
+# saving or deleting a Friendship drops both users' entries.
+CHAT_FRIENDS = {
+    "CACHE": "default",
+    "TIMEOUT": int(os.getenv("CHAT_FRIENDS_TIMEOUT", "3600")),
+}
+
+# Token buckets per event type as (tokens per second, burst), for one socket
+# ("connection") and for all of a user's sockets and REST sends ("user");
+# see chat/ratelimit.py. Exceeding one drops the event with a rate_limited frame.
+CHAT_RATE_LIMITS_ENABLED = os.getenv("CHAT_RATE_LIMITS_ENABLED", "True") == "True"
+CHAT_RATE_LIMITS = {
+    "message": {
+        "connection": (float(os.getenv("CHAT_MESSAGE_RATE", "5")), int(os.getenv("CHAT_MESSAGE_BURST", "20"))),
+        "user": (float(os.getenv("CHAT_USER_MESSAGE_RATE", "10")), int(os.getenv("CHAT_USER_MESSAGE_BURST", "40"))),
+    },
+    "read": {"connection": (10.0, 30)},
+    "subscribe": {"connection": (1.0, 10)},
+}
+
+# Frames queued for one socket (see chat/outbox.py): past HIGH_WATER typing and
+# presence frames are dropped and read receipts coalesced; past LIMIT the
+# socket is closed with code 4008 and the client resumes with last_seq.
+CHAT_OUTBOX = {
+    "HIGH_WATER": int(os.getenv("CHAT_OUTBOX_HIGH_WATER", "200")),
+    "LIMIT": int(os.getenv("CHAT_OUTBOX_LIMIT", "1000")),
+}
+
+# Threads one ws/chat/ connection may subscribe to at once
+CHAT_MAX_SUBSCRIPTIONS = int(os.getenv("CHAT_MAX_SUBSCRIPTIONS", "200"))
+
+# Consumers run their database calls on a pool of their own (chat/executor.py),
+# apart from the threads serving HTTP views. Past CHAT_DB_QUEUE waiting calls a
+# frame is answered with server_busy instead of queueing. Each worker holds a
+# database connection while it runs.
+CHAT_DB_EXECUTOR = {
+    "WORKERS": int(os.getenv("CHAT_DB_WORKERS", str(min(32, (os.cpu_count() or 1) * 2)))),
+    "QUEUE": int(os.getenv("CHAT_DB_QUEUE", "64")),
+}
+
+# Consumer reads (membership, friend ids, replay, token fallback auth) use
+# Django's async ORM API instead of the executor above. Off by default; run
+# benchmarks/consumer_orm.py against your database before turning it on.
+CHAT_ASYNC_ORM = os.getenv("CHAT_ASYNC_ORM", "False") == "True"
+
+# Typing and presence frames never touch the database. Presence leases expire
+# after CHAT_PRESENCE_TTL seconds unless refreshed by a heartbeat frame.
+CHAT_PRESENCE_TTL = int(os.getenv("CHAT_PRESENCE_TTL", "60"))
+# Minimum seconds between two ephemeral frames of a kind on one connection
+CHAT_EPHEMERAL_MIN_INTERVAL = {
+    "typing": 1.0,
+    "heartbeat": 5.0,
+    "presence": 2.0,
+}
+
+# GET /metrics serves Prometheus metrics for this process (see chat/metrics.py)
+# once METRICS_ENABLED=True; with METRICS_TOKEN set it requires
+# "Authorization: Bearer <token>". Off by default: it is public without a token.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "False") == "True"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework_simplejwt.authentication.JWTAuthentication",
@@ -161,5 +354,7 @@ from datetime import timedelta
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=500),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
+    # Adds the username claim read by chat.auth.JWTAuthMiddleware
+    "TOKEN_OBTAIN_SERIALIZER": "chat.serializers.ChatTokenObtainPairSerializer",
     # add other options as needed
 }